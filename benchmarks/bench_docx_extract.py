@@ -0,0 +1,131 @@
+"""
+DOCX extraction: the old python-docx + ElementTree + minidom round-trip vs the iterparse extractor.
+
+Each mode runs in its own subprocess so ru_maxrss reflects only that mode. The outputs are
+also compared: the old extractor put all tables after all paragraphs, the new one keeps
+document order, so the check is that both produce the same set of lines.
+
+    python benchmarks/bench_docx_extract.py --paragraphs 2500 --repeat 3
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def run_legacy(doc_bytes: bytes) -> str:
+    # Прежняя реализация get_text_from_docx
+    import xml.etree.ElementTree as ET
+    from xml.dom import minidom
+    from docx import Document
+
+    root = ET.Element("extracted_text")
+    doc = Document(io.BytesIO(doc_bytes))
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            text_elem = ET.SubElement(root, "text")
+            text_elem.text = paragraph.text.strip()
+    for table in doc.tables:
+        table_elem = ET.SubElement(root, "table")
+        for row in table.rows:
+            row_elem = ET.SubElement(table_elem, "row")
+            for cell in row.cells:
+                col_elem = ET.SubElement(row_elem, "coloumn")
+                cell_text = ""
+                for paragraph in cell.paragraphs:
+                    if paragraph.text.strip():
+                        cell_text += paragraph.text.strip() + " "
+                col_elem.text = cell_text.strip()
+    rough_string = ET.tostring(root, 'utf-8')
+    reparsed = minidom.parseString(rough_string)
+    return reparsed.toprettyxml(indent="  ").replace('<?xml version="1.0" ?>\n', '')
+
+
+def run_streaming(doc_bytes: bytes) -> str:
+    from services.ai_services.extraction.formats.format_utils.format_utils import get_text_from_docx
+
+    return get_text_from_docx(doc_bytes)
+
+
+def child(mode: str, path: str, repeat: int) -> None:
+    with open(path, "rb") as f:
+        doc_bytes = f.read()
+    extract = run_legacy if mode == "legacy" else run_streaming
+    # Импорты не входят ни во время, ни в прирост памяти
+    if mode == "legacy":
+        import docx  # noqa: F401
+        from xml.dom import minidom  # noqa: F401
+    else:
+        import services.ai_services.extraction.formats.format_utils.format_utils  # noqa: F401
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = extract(doc_bytes)
+        timings.append(time.perf_counter() - started)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with open(f"{path}.{mode}.xml", "w", encoding="utf-8") as f:
+        f.write(output)
+    print(json.dumps({
+        "mode": mode,
+        "best_seconds": min(timings),
+        "mean_seconds": sum(timings) / len(timings),
+        "output_chars": len(output),
+        "peak_rss_mb": peak_kb / 1024,
+        "delta_rss_mb": (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=2500, help="~5 paragraphs per page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--docx", help="benchmark an existing file instead of a generated one")
+    parser.add_argument("--child", choices=["legacy", "streaming"])
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.docx, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.docx")
+        if args.docx:
+            with open(args.docx, "rb") as src, open(path, "wb") as dst:
+                dst.write(src.read())
+        else:
+            from fixtures import make_docx
+
+            with open(path, "wb") as f:
+                f.write(make_docx(args.paragraphs))
+
+        results = []
+        for mode in ("legacy", "streaming"):
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", mode, "--docx", path, "--repeat", str(args.repeat)]
+            )
+            results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+        with open(f"{path}.legacy.xml", encoding="utf-8") as f:
+            legacy_lines = sorted(f.read().splitlines())
+        with open(f"{path}.streaming.xml", encoding="utf-8") as f:
+            streaming_lines = sorted(f.read().splitlines())
+
+    print(json.dumps({
+        "docx_bytes": os.path.getsize(args.docx) if args.docx else None,
+        "same_content": legacy_lines == streaming_lines,
+        "speedup": results[0]["best_seconds"] / results[1]["best_seconds"],
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
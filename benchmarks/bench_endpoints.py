@@ -0,0 +1,274 @@
+"""
+Throughput, latency percentiles and peak RSS of the /extract/* and /generate/* endpoints.
+
+The app runs in-process with its OpenRouter client pointed at mock_openrouter.py, so no
+API money is spent and the upstream latency is under control. Each scenario runs in its
+own subprocess, so peak RSS reflects only that scenario. Results are written as JSON and
+can be compared with a previous run:
+
+    python benchmarks/bench_endpoints.py --requests 50 --concurrency 8 --output before.json
+    python benchmarks/bench_endpoints.py --requests 50 --concurrency 8 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fixtures import SIZES, make_fixture  # noqa: E402
+from mock_openrouter import add_mock_arguments, create_mock_app, mock_settings_from_args  # noqa: E402
+
+MOCK_BASE_URL = "http://mock-openrouter/api/v1"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Сценарий: эндпоинт, фикстура и размер; stream - потоковый ответ /generate/*
+SCENARIOS: Dict[str, Dict[str, Any]] = {}
+for _size in SIZES:
+    SCENARIOS[f"extract_txt_{_size}"] = {"path": "/extract/txt", "fixture": "txt", "size": _size}
+    SCENARIOS[f"extract_pdf_{_size}"] = {"path": "/extract/pdf", "fixture": "pdf", "size": _size}
+    SCENARIOS[f"extract_scanned_pdf_{_size}"] = {"path": "/extract/pdf", "fixture": "scanned_pdf", "size": _size}
+    SCENARIOS[f"extract_doc_{_size}"] = {"path": "/extract/doc", "fixture": "docx", "size": _size}
+    SCENARIOS[f"extract_png_{_size}"] = {"path": "/extract/png", "fixture": "png", "size": _size}
+    SCENARIOS[f"generate_summary_{_size}"] = {"path": "/generate/summary", "fixture": "txt", "size": _size}
+SCENARIOS["generate_summary_small_stream"] = {"path": "/generate/summary", "fixture": "txt", "size": "small", "stream": True}
+SCENARIOS["generate_test_small"] = {"path": "/generate/test", "fixture": "txt", "size": "small"}
+SCENARIOS["generate_test_small_stream"] = {"path": "/generate/test", "fixture": "txt", "size": "small", "stream": True}
+
+
+def skip_reason(scenario: Dict[str, Any]) -> Optional[str]:
+    if scenario["fixture"] == "scanned_pdf" and shutil.which("pdftoppm") is None:
+        return "poppler (pdftoppm) is not installed"
+    return None
+
+
+def configure_environment(tmp: str) -> None:
+    """Settings the app reads at import time: mock upstream, no response cache, scratch databases."""
+    os.environ.update({
+        "OPENROUTER_API_KEY": "bench",
+        "OPENROUTER_MODEL": "mock/model",
+        "OPENROUTER_BASE_URL": MOCK_BASE_URL,
+        "OPENROUTER_BACKOFF_BASE": os.environ.get("OPENROUTER_BACKOFF_BASE", "0.1"),
+        "GENERATE_BACKEND": "openrouter",
+        # Повторные запросы с одинаковым телом иначе отдавались бы из кэша
+        "LLM_CACHE_ENABLED": "false",
+        "PAGE_CACHE_ENABLED": "false",
+        "CHUNK_STORE_ENABLED": "false",
+        # Одинаковые одновременные запросы иначе объединялись бы в один
+        "LLM_COALESCE_ENABLED": "false",
+        "JOBS_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+    })
+
+
+def build_request(scenario: Dict[str, Any], data: bytes) -> Dict[str, Any]:
+    path = scenario["path"]
+    if path.startswith("/generate/"):
+        return {"json": {"text": data.decode("utf-8"), "language": "English", "stream": scenario.get("stream", False)}}
+    if path == "/extract/png":
+        return {"data": {"files": [base64.b64encode(data).decode("ascii")], "language": "English"}}
+    content_type = {"txt": "text/plain", "pdf": "application/pdf", "scanned_pdf": "application/pdf", "docx": DOCX_MIME}
+    name = f"fixture.{scenario['fixture'].split('_')[-1]}"
+    return {"files": {"files" if path == "/extract/txt" else "file": (name, data, content_type[scenario["fixture"]])},
+            "data": {"language": "English"}}
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def run_scenario(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import server
+    from services.ai_services.ai_utils.http_client import init_http_client
+
+    scenario = SCENARIOS[name]
+    data = make_fixture(scenario["fixture"], scenario["size"])
+    request = build_request(scenario, data)
+    mock = create_mock_app(mock_settings_from_args(args))
+
+    # Клиент к OpenRouter создается до lifespan, поэтому lifespan переиспользует его
+    await init_http_client(transport=httpx.ASGITransport(app=mock))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(record: bool) -> None:
+                started = time.perf_counter()
+                response = await client.post(scenario["path"], **request)
+                elapsed = time.perf_counter() - started
+                if record:
+                    statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+
+            # Прогрев: импорт модулей, запуск пула процессов
+            for _ in range(args.warmup):
+                await one(record=False)
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def limited() -> None:
+                async with semaphore:
+                    await one(record=True)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(limited() for _ in range(args.requests)))
+            wall = time.perf_counter() - started
+
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "scenario": name,
+        "endpoint": scenario["path"],
+        "fixture": scenario["fixture"],
+        "size": scenario["size"],
+        "stream": scenario.get("stream", False),
+        "input_bytes": len(data),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "statuses": statuses,
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else None,
+        "latency_seconds": {
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) if latencies else None,
+        },
+        "upstream_requests": mock.state.stats["requests"],
+        "upstream_rate_limited": mock.state.stats["rate_limited"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        # Наибольший RSS среди завершенных дочерних процессов (пул CPU)
+        "children_peak_rss_mb": children_kb / 1024,
+    }
+
+
+def child(name: str, args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp)
+        result = asyncio.run(run_scenario(name, args))
+    print(json.dumps(result))
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> bool:
+    """Prints per-scenario deltas against a previous run. Returns False if p95 regressed beyond threshold."""
+    with open(baseline_path) as f:
+        baseline = {r["scenario"]: r for r in json.load(f)["results"] if "skipped" not in r}
+
+    ok = True
+    print(f"{'scenario':36} {'p50':>16} {'p95':>16} {'rps':>16} {'rss MB':>16}")
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if before is None or "skipped" in result or result["latency_seconds"]["p95"] is None:
+            continue
+
+        def delta(old, new):
+            if not old or new is None:
+                return f"{new}"
+            return f"{new:.3f} ({(new - old) / old:+.0%})"
+
+        old_p95, new_p95 = before["latency_seconds"]["p95"], result["latency_seconds"]["p95"]
+        print(f"{result['scenario']:36} "
+              f"{delta(before['latency_seconds']['p50'], result['latency_seconds']['p50']):>16} "
+              f"{delta(old_p95, new_p95):>16} "
+              f"{delta(before['throughput_rps'], result['throughput_rps']):>16} "
+              f"{delta(before['peak_rss_mb'], result['peak_rss_mb']):>16}")
+        if old_p95 and new_p95 > old_p95 * (1 + threshold):
+            ok = False
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", action="append", default=[], help="run scenarios containing this substring")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95 regression for --compare")
+    parser.add_argument("--list", action="store_true", help="print scenario names and exit")
+    parser.add_argument("--child")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(SCENARIOS))
+        return
+    if args.child:
+        child(args.child, args)
+        return
+
+    names = [name for name in SCENARIOS if not args.only or any(part in name for part in args.only)]
+    forwarded = [arg for arg in sys.argv[1:] if arg not in ("--list",)]
+    results = []
+    for name in names:
+        reason = skip_reason(SCENARIOS[name])
+        if reason:
+            results.append({"scenario": name, "skipped": reason})
+            print(f"{name}: skipped ({reason})", file=sys.stderr)
+            continue
+        process = subprocess.run(
+            [sys.executable, __file__, *forwarded, "--child", name], capture_output=True, text=True
+        )
+        if process.returncode != 0:
+            results.append({"scenario": name, "error": process.stderr.strip().splitlines()[-1:]})
+            print(f"{name}: failed\n{process.stderr}", file=sys.stderr)
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append(result)
+        latency = result["latency_seconds"]
+        print(f"{name}: {result['throughput_rps'] or 0:.1f} rps, p50 {latency['p50'] or 0:.3f}s, "
+              f"p95 {latency['p95'] or 0:.3f}s, p99 {latency['p99'] or 0:.3f}s, "
+              f"rss {result['peak_rss_mb']:.0f} MB, statuses {result['statuses']}", file=sys.stderr)
+
+    report = {
+        "revision": git_revision(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mock": mock_settings_from_args(args).model_dump(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
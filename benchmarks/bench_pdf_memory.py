@@ -0,0 +1,102 @@
+"""
+Peak memory of PDF rasterization: the old all-pages-at-once conversion vs the pipeline of
+/extract/pdf (render_pdf_pages on batches of PDF_PAGES_PER_REQUEST pages).
+
+Each mode runs in its own subprocess so ru_maxrss reflects only that mode.
+
+    python benchmarks/bench_pdf_memory.py --pages 100
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def make_pdf(path: str, pages: int) -> None:
+    from PIL import Image, ImageDraw
+
+    images = []
+    for number in range(pages):
+        image = Image.new("RGB", (1240, 1754), "white")
+        draw = ImageDraw.Draw(image)
+        for line in range(60):
+            draw.text((80, 80 + line * 26), f"Page {number + 1}, line {line + 1}: lorem ipsum dolor sit amet", fill="black")
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:])
+
+
+# Разрешение, с которым растеризует iter_pdf_images
+DPI = 200
+
+
+def run_legacy(pdf_path: str) -> int:
+    # Прежняя реализация: все страницы, RGB-копии и base64 одновременно
+    from pdf2image import convert_from_bytes
+
+    with open(pdf_path, "rb") as f:
+        pdf_bytes = f.read()
+    images = convert_from_bytes(pdf_bytes, dpi=DPI, fmt="jpeg", thread_count=4, use_pdftocairo=True, transparent=False)
+    images = [image.convert("RGB") for image in images]
+    encoded = []
+    for image in images:
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        encoded.append(base64.b64encode(buffer.getvalue()).decode("utf-8"))
+    return len(encoded)
+
+
+def run_streaming(pdf_path: str) -> int:
+    # Как _extract_batches: загруженный PDF лежит в файле, пачки растеризуются по одной
+    from services.ai_services.extraction.formats.format_utils.format_utils import (
+        render_pdf_pages, get_pdf_page_count, PDF_PAGES_PER_REQUEST
+    )
+
+    count = 0
+    pages = get_pdf_page_count(pdf_path)
+    for first in range(1, pages + 1, PDF_PAGES_PER_REQUEST):
+        last = min(first + PDF_PAGES_PER_REQUEST - 1, pages)
+        images, _, _, _ = render_pdf_pages(pdf_path, first_page=first, last_page=last)
+        count += len(images)
+    return count
+
+
+def child(mode: str, pdf_path: str) -> None:
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pages = run_legacy(pdf_path) if mode == "legacy" else run_streaming(pdf_path)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "pages": pages, "peak_rss_mb": peak_kb / 1024, "delta_rss_mb": (peak_kb - baseline_kb) / 1024}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--child", choices=["legacy", "streaming"])
+    parser.add_argument("--pdf")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.pdf)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "bench.pdf")
+        make_pdf(pdf_path, args.pages)
+        results = []
+        for mode in ("legacy", "streaming"):
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--child", mode, "--pdf", pdf_path]
+            )
+            results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold-start time and idle RSS of the app, as seen by a short-lived worker pod.
+
+Every measurement runs in a fresh interpreter: import of server.py, then the lifespan
+startup (HTTP client, job queue), then RSS while idle. The "eager" configuration also
+imports the heavy optional libraries up front, i.e. what every pod paid before they were
+loaded on first use. "cpu_worker" is the import a process-pool worker does before its
+first task.
+
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+HEAVY_MODULES = ["google.generativeai", "pdf2image", "PyPDF2", "pytesseract", "docx", "PIL.Image"]
+
+# Конфигурация: переменные окружения и модули, импортируемые заранее
+CONFIGURATIONS: Dict[str, Dict[str, Any]] = {
+    "default": {"env": {}},
+    "eager": {"env": {}, "preload": ["google.generativeai", "pdf2image", "PyPDF2", "pytesseract"]},
+    "txt_only": {"env": {"ENABLED_EXTRACTORS": "txt"}},
+    "gemini_backend": {"env": {"LLM_BACKENDS": "gemini"}},
+    "cpu_worker": {"env": {}, "target": "services.ai_services.extraction.formats.format_utils.format_utils"},
+}
+
+CHILD = r"""
+import asyncio, importlib, json, resource, sys, time
+started = time.perf_counter()
+for name in {preload!r}:
+    importlib.import_module(name)
+module = importlib.import_module({target!r})
+imported = time.perf_counter()
+if {target!r} == "server":
+    async def run():
+        async with module.app.router.lifespan_context(module.app):
+            await asyncio.sleep(0)
+            return time.perf_counter()
+    ready = asyncio.run(run())
+else:
+    ready = imported
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "startup_seconds": ready - started,
+    "idle_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules),
+    "heavy_loaded": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(name: str, repeat: int) -> Dict[str, Any]:
+    config = CONFIGURATIONS[name]
+    code = CHILD.format(preload=config.get("preload", []), target=config.get("target", "server"), heavy=HEAVY_MODULES)
+    runs: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "PYTHONPATH": ROOT,
+            "OPENROUTER_API_KEY": "bench",
+            # Без прогрева соединений: измеряем только сам процесс
+            "OPENROUTER_WARMUP_CONNECTIONS": "0",
+            "JOBS_DB_PATH": os.path.join(tmp, "jobs.sqlite3"),
+            "LLM_CACHE_PATH": os.path.join(tmp, "llm_cache.sqlite3"),
+            "PAGE_CACHE_PATH": os.path.join(tmp, "page_cache.sqlite3"),
+            "CHUNK_STORE_PATH": os.path.join(tmp, "chunk_store.sqlite3"),
+            **config["env"],
+        }
+        for _ in range(repeat):
+            output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+            runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    return {
+        "configuration": name,
+        "env": config["env"],
+        "import_seconds": min(run["import_seconds"] for run in runs),
+        "startup_seconds": min(run["startup_seconds"] for run in runs),
+        "idle_rss_mb": min(run["idle_rss_mb"] for run in runs),
+        "modules": runs[-1]["modules"],
+        "heavy_loaded": runs[-1]["heavy_loaded"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per configuration, the best one is reported")
+    parser.add_argument("--only", action="append", default=[], choices=list(CONFIGURATIONS))
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.only or CONFIGURATIONS:
+        result = measure(name, args.repeat)
+        results.append(result)
+        print(f"{name:16} startup {result['startup_seconds']:.3f}s (import {result['import_seconds']:.3f}s), "
+              f"idle rss {result['idle_rss_mb']:.0f} MB, {result['modules']} modules, "
+              f"heavy: {', '.join(result['heavy_loaded']) or '-'}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
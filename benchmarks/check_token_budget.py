@@ -0,0 +1,54 @@
+"""
+Regression check for the local token estimate on the payload shapes the app actually sends.
+
+Vision requests (get_png_payload: "input_text" + "input_image" with a plain data URL) must be
+counted with their image tokens and must never recalibrate chars_per_token, otherwise a run of
+/extract/pdf or /extract/png requests shrinks max_input_chars for every text request.
+
+    python benchmarks/check_token_budget.py
+"""
+import base64
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENROUTER_API_KEY", "check")
+
+from PIL import Image
+from services.ai_services.ai_utils.token_budget import TokenEstimator, TOKEN_CHARS_PER_TOKEN
+from services.ai_services.extraction.formats.format_utils.format_utils import get_png_payload
+
+
+def page_image(width: int = 1240, height: int = 1754) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def main() -> None:
+    estimator = TokenEstimator(context_tokens=32768)
+    text_limit = estimator.max_input_chars()
+
+    payload = get_png_payload(prompt="Please extract text from these pictures.", images_base64=[page_image()] * 3)
+    plan = estimator.plan("system prompt", payload)
+    assert plan.image_tokens > 3 * 85, f"vision payload estimated at {plan.image_tokens} image tokens"
+    assert not plan.text_only
+
+    # Провайдер считает изображения в prompt_tokens: это не должно менять оценку для текста
+    for _ in range(30):
+        estimator.record(plan, {"prompt_tokens": plan.prompt_tokens + 3000})
+    assert estimator.chars_per_token == TOKEN_CHARS_PER_TOKEN, estimator.chars_per_token
+    assert estimator.max_input_chars() == text_limit
+
+    # Текстовые запросы по-прежнему калибруют оценку
+    text_plan = estimator.plan("system prompt", [{"type": "input_text", "text": "word " * 2000}])
+    assert text_plan.text_only
+    estimator.record(text_plan, {"prompt_tokens": 2000})
+    assert estimator.stats["calibrations"] == 1
+
+    print(f"ok: {plan.image_tokens} image tokens for 3 pages, chars_per_token {estimator.chars_per_token:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Generated documents for the benchmarks, in increasing sizes.
+
+Everything is built in memory from fixed seeds, so runs on different commits see
+byte-identical inputs. To inspect the fixtures:
+
+    python benchmarks/fixtures.py --out /tmp/fixtures
+"""
+import argparse
+import io
+import os
+import random
+from typing import Callable, Dict, List
+
+# Размеры фикстур: имя -> параметр генератора
+TEXT_SIZES = {"small": 2_000, "medium": 20_000, "large": 200_000}
+PDF_PAGES = {"small": 1, "medium": 10, "large": 50}
+DOCX_PARAGRAPHS = {"small": 10, "medium": 200, "large": 2000}
+PNG_SIZES = {"small": (800, 600), "medium": (1654, 2339), "large": (3508, 4961)}
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip"
+).split()
+
+
+def make_text(chars: int, seed: int = 0) -> str:
+    """Paragraphs of pseudo-random words, roughly `chars` characters long."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < chars:
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 16))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)[:chars]
+
+
+def make_text_pdf(pages: int, seed: int = 0) -> bytes:
+    """PDF with a real text layer (Helvetica), so extraction does not need rasterization."""
+    rng = random.Random(seed)
+    page_count = max(pages, 1)
+    font_ref = 3 + 2 * page_count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count)), page_count
+        ),
+    ]
+    for index in range(page_count):
+        lines = []
+        for line in range(45):
+            words = " ".join(rng.choice(_WORDS) for _ in range(10))
+            lines.append(f"({index + 1}.{line + 1} {words}) Tj T*")
+        stream = "BT /F1 11 Tf 14 TL 56 780 Td " + " ".join(lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + 2 * index} 0 R "
+            f"/Resources << /Font << /F1 {font_ref} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def _page_image(width: int, height: int, label: str, seed: int):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    step = max(height // 70, 12)
+    for line, y in enumerate(range(step * 2, height - step * 2, step)):
+        words = " ".join(rng.choice(_WORDS) for _ in range(12))
+        draw.text((step * 2, y), f"{label} {line + 1}: {words}", fill="black")
+    return image
+
+
+def make_scanned_pdf(pages: int, seed: int = 0) -> bytes:
+    """Image-only PDF (no text layer), exercises rasterization and the vision path."""
+    images = [_page_image(1240, 1754, f"Page {number + 1}", seed + number) for number in range(max(pages, 1))]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+
+def make_docx(paragraphs: int, seed: int = 0) -> bytes:
+    """DOCX with headings, paragraphs and a table every 50 paragraphs."""
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    for index in range(paragraphs):
+        if index % 20 == 0:
+            document.add_heading(f"Section {index // 20 + 1}", level=1)
+        document.add_paragraph(make_text(rng.randint(200, 600), seed=seed + index))
+        if index % 50 == 49:
+            table = document.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = " ".join(rng.choice(_WORDS) for _ in range(3))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    buffer = io.BytesIO()
+    _page_image(width, height, "Line", seed).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+FIXTURES: Dict[str, Callable[[str], bytes]] = {
+    "txt": lambda size: make_text(TEXT_SIZES[size]).encode("utf-8"),
+    "pdf": lambda size: make_text_pdf(PDF_PAGES[size]),
+    # Сканы читаются обратно только через poppler
+    "scanned_pdf": lambda size: make_scanned_pdf(PDF_PAGES[size]),
+    "docx": lambda size: make_docx(DOCX_PARAGRAPHS[size]),
+    "png": lambda size: make_png(*PNG_SIZES[size]),
+}
+SIZES = ("small", "medium", "large")
+
+
+def make_fixture(kind: str, size: str) -> bytes:
+    return FIXTURES[kind](size)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    written: List[str] = []
+    for kind in FIXTURES:
+        for size in SIZES:
+            data = make_fixture(kind, size)
+            path = os.path.join(args.out, f"{size}_{kind}.{kind.split('_')[-1]}")
+            with open(path, "wb") as f:
+                f.write(data)
+            written.append(f"{path} ({len(data) / 1024:.0f} KB)")
+    print("\n".join(written))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Local stand-in for the OpenRouter chat completions API.
+
+Answers POST {base}/chat/completions with a canned completion after a configurable
+latency, streams it as SSE when the request asks for `stream`, and can emulate the
+provider quota with 429 + Retry-After. Used in-process by bench_endpoints.py through
+httpx.ASGITransport, or standalone so a real server can point OPENROUTER_BASE_URL at it:
+
+    python benchmarks/mock_openrouter.py --port 9000 --latency 0.5 --rpm 60
+    OPENROUTER_BASE_URL=http://127.0.0.1:9000/api/v1 python server.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Any, Dict
+
+from pydantic import BaseModel
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class MockSettings(BaseModel):
+    # Задержка до ответа (для потока - до первого чанка)
+    latency: float = 0.2
+    # Случайная добавка к задержке, равномерно в [0, jitter]
+    jitter: float = 0.05
+    # Задержка между чанками потокового ответа
+    stream_chunk_delay: float = 0.01
+    stream_chunks: int = 20
+    # Длина ответа модели в символах
+    response_chars: int = 1500
+    # Квота запросов в минуту, сверх нее - 429 с точным Retry-After; 0 - без квоты
+    rpm: int = 0
+    # Доля случайных 429, независимо от квоты
+    rate_limit_probability: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+
+
+def _completion_text(chars: int) -> str:
+    piece = "<summary_piece><subtitle>Mock</subtitle><text>Lorem ipsum dolor sit amet.</text></summary_piece>"
+    body = (piece * (chars // len(piece) + 1))[:max(chars - len("<summary></summary>"), 0)]
+    return f"<summary>{body}</summary>"
+
+
+def create_mock_app(settings: MockSettings = MockSettings()) -> Starlette:
+    rng = random.Random(settings.seed)
+    text = _completion_text(settings.response_chars)
+    window: deque = deque()
+    stats = {"requests": 0, "rate_limited": 0, "streams": 0}
+
+    def rate_limited() -> float:
+        """Returns Retry-After seconds if this request is over quota, otherwise 0."""
+        now = time.monotonic()
+        if settings.rpm > 0:
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= settings.rpm:
+                return 60 - (now - window[0])
+            window.append(now)
+        if settings.rate_limit_probability and rng.random() < settings.rate_limit_probability:
+            return settings.retry_after
+        return 0.0
+
+    def usage(payload: Dict[str, Any]) -> Dict[str, int]:
+        prompt_tokens = len(json.dumps(payload.get("messages", []), ensure_ascii=False)) // 4
+        completion_tokens = len(text) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def stream(payload: Dict[str, Any]):
+        size = max(len(text) // settings.stream_chunks, 1)
+        for start in range(0, len(text), size):
+            chunk = {"choices": [{"delta": {"content": text[start:start + size]}, "finish_reason": None}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await asyncio.sleep(settings.stream_chunk_delay)
+        final = {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": usage(payload)}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def chat_completions(request: Request) -> Response:
+        stats["requests"] += 1
+        payload = await request.json()
+        retry_after = rate_limited()
+        if retry_after:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                status_code=429,
+                headers={"Retry-After": f"{retry_after:.3f}"}
+            )
+
+        await asyncio.sleep(settings.latency + rng.uniform(0, settings.jitter))
+        if payload.get("stream"):
+            stats["streams"] += 1
+            return StreamingResponse(stream(payload), media_type="text/event-stream")
+
+        return JSONResponse({
+            "id": "gen-mock",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage(payload),
+        })
+
+    async def index(request: Request) -> Response:
+        # Прогрев соединений в http_client делает HEAD на базовый URL
+        return Response(status_code=200)
+
+    async def get_stats(request: Request) -> Response:
+        return JSONResponse(stats)
+
+    app = Starlette(routes=[
+        Route("/api/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/api/v1/_stats", get_stats, methods=["GET"]),
+        Route("/api/v1", index, methods=["GET", "HEAD"]),
+    ])
+    app.state.stats = stats
+    return app
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = MockSettings()
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="upstream latency, seconds")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="random extra latency, seconds")
+    parser.add_argument("--stream-chunk-delay", type=float, default=defaults.stream_chunk_delay)
+    parser.add_argument("--response-chars", type=int, default=defaults.response_chars)
+    parser.add_argument("--rpm", type=int, default=defaults.rpm, help="emulated provider quota, 0 - unlimited")
+    parser.add_argument("--rate-limit-probability", type=float, default=defaults.rate_limit_probability)
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def mock_settings_from_args(args: argparse.Namespace) -> MockSettings:
+    return MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        stream_chunk_delay=args.stream_chunk_delay,
+        response_chars=args.response_chars,
+        rpm=args.rpm,
+        rate_limit_probability=args.rate_limit_probability,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(mock_settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Production launcher: several uvicorn worker processes behind one port.
+
+    WEB_CONCURRENCY=4 python serve.py
+
+Workers share state through SQLite (WAL) files, not through memory:
+- квоты OpenRouter - RATE_LIMIT_DB_PATH (по умолчанию .cache/rate_limit.sqlite3 при нескольких воркерах);
+- кэш ответов модели и кэш страниц - LLM_CACHE_PATH и PAGE_CACHE_PATH;
+- фоновые задачи - JOBS_DB_PATH: задачу выполняет воркер, который ее захватил,
+  а задачи упавшего воркера подхватывают остальные.
+
+On SIGTERM uvicorn stops accepting connections and waits up to GRACEFUL_TIMEOUT seconds
+for in-flight requests (LLM calls included), then the lifespan shutdown drains running jobs.
+Счетчики /metrics у каждого воркера свои.
+"""
+import os
+import logging
+import importlib.util
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("serve")
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8000))
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+# auto | uvloop | asyncio и auto | httptools | h11; auto берет быструю реализацию, если она установлена
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "auto")
+UVICORN_HTTP = os.getenv("UVICORN_HTTP", "auto")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info")
+# Должен покрывать самый долгий запрос к модели, иначе он оборвется при перезапуске
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 90))
+KEEPALIVE_TIMEOUT = int(os.getenv("KEEPALIVE_TIMEOUT", 5))
+BACKLOG = int(os.getenv("BACKLOG", 2048))
+# Максимум одновременных соединений на воркер; сверх - 503
+LIMIT_CONCURRENCY = int(os.getenv("LIMIT_CONCURRENCY", 0)) or None
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+_IMPLEMENTATIONS = {
+    "loop": ("uvloop", "asyncio"),
+    "http": ("httptools", "h11"),
+}
+
+
+def resolve_implementation(kind: str, requested: str) -> str:
+    """Picks the fast implementation for "auto" if it is installed; an explicit choice must be installed."""
+    fast, fallback = _IMPLEMENTATIONS[kind]
+    installed = importlib.util.find_spec(fast) is not None
+    if requested == "auto":
+        chosen = fast if installed else fallback
+        if not installed:
+            logger.warning(f"{fast} is not installed, using {fallback}")
+        return chosen
+    if requested == fast and not installed:
+        raise RuntimeError(f"UVICORN_{kind.upper()}={fast}, but {fast} is not installed")
+    if requested not in (fast, fallback):
+        raise ValueError(f"Unknown UVICORN_{kind.upper()}: {requested}")
+    return requested
+
+
+def configure_shared_state(workers: int) -> None:
+    """Defaults that only make sense with several processes; explicit environment values win."""
+    if workers <= 1:
+        return
+    # Квоты провайдера общие на все воркеры, иначе каждый расходовал бы всю квоту
+    os.environ.setdefault("RATE_LIMIT_DB_PATH", os.path.join(".cache", "rate_limit.sqlite3"))
+    # Пул процессов для CPU-задач делится между воркерами, а не создается на все ядра в каждом
+    os.environ.setdefault("CPU_POOL_WORKERS", str(max((os.cpu_count() or 1) // workers, 1)))
+
+
+def main() -> None:
+    logging.basicConfig(level=LOG_LEVEL.upper(), format="%(levelname)s: %(name)s: %(message)s")
+    workers = max(WEB_CONCURRENCY, 1)
+    configure_shared_state(workers)
+    loop = resolve_implementation("loop", UVICORN_LOOP)
+    http = resolve_implementation("http", UVICORN_HTTP)
+    logger.info(f"Starting {workers} workers on {HOST}:{PORT} (loop={loop}, http={http})")
+
+    uvicorn.run(
+        "server:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        log_level=LOG_LEVEL,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        backlog=BACKLOG,
+        limit_concurrency=LIMIT_CONCURRENCY,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
+
+
+if __name__ == "__main__":
+    main()
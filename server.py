@@ -1,28 +1,79 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import uvicorn
 
 # Импортируем созданные нами модули с роутерами
 from services.ai_services.generation.generate_router import router as generate_router
 from services.ai_services.extraction.extraction_router import router as extract_router
+from services.ai_services.jobs.job_router import router as jobs_router
+from services.ai_services.pipeline.pipeline_router import router as pipeline_router
+from services.ai_services.jobs.job_queue import start_job_queue, stop_job_queue
+from services.ai_services.ai_utils.http_client import init_http_client, close_http_client
+from services.ai_services.extraction.formats.format_utils.cpu_pool import shutdown_cpu_pool, pool_stats
+from services.ai_services.ai_utils.metrics import TimedJSONResponse, metrics_middleware, register_stats
+from services.ai_services.extraction.formats.format_utils.uploads import UploadSizeLimitMiddleware
+from services.ai_services.ai_utils.response_cache import response_cache
+from services.ai_services.ai_utils.rate_limit import upstream_limiter
+from services.ai_services.ai_utils.backends import backend_router
+from services.ai_services.generation.question_pool import question_pool
+from services.ai_services.ai_utils.token_budget import token_estimator
+from services.ai_services.ai_utils.coalescing import single_flight
+from services.ai_services.extraction.registry import enabled_extractors
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Один пул соединений к OpenRouter на всё приложение
+    await init_http_client()
+    await start_job_queue()
+    yield
+    await stop_job_queue()
+    await question_pool.stop()
+    await close_http_client()
+    shutdown_cpu_pool()
+
 
 # Создаем экземпляр FastAPI
-app = FastAPI(title="AI Summary", description="Makes summary from the text and generates tests of this summary for better learning")
+app = FastAPI(title="AI Summary", description="Makes summary from the text and generates tests of this summary for better learning", lifespan=lifespan, default_response_class=TimedJSONResponse)
+app.middleware("http")(metrics_middleware)
+# Слишком большие загрузки отклоняются до того, как Starlette запишет их целиком
+app.add_middleware(UploadSizeLimitMiddleware)
+
+# Счетчики модулей, которые хранятся в обычных словарях; модули, загружаемые при первом
+# использовании (кэш страниц, OCR, хранилище кусков, пулы вопросов), регистрируют свои сами
+register_stats("llm_cache", response_cache.get_stats)
+register_stats("cpu_pool", lambda: pool_stats)
+register_stats("upstream_limiter", lambda: upstream_limiter.stats)
+register_stats("llm_backend", backend_router.get_stats)
+register_stats("token_budget", token_estimator.get_stats)
+register_stats("coalescing", single_flight.get_stats)
 
 # Подключаем роутеры к приложению
 app.include_router(extract_router)
 app.include_router(generate_router)
+app.include_router(jobs_router)
+app.include_router(pipeline_router)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
     return {
         "message": "AI API is running. Available endpoints:",
         "endpoints": [
-            "/extract/png",
-            "/extract/pdf",
-            "/extract/doc",
-            "/extract/txt",
+            *(f"/extract/{name}" for name in enabled_extractors()),
             "/generate/summary",
             "/generate/test",
+            "/generate/test/pool",
+            "/generate/batch",
+            f"/jobs/extract/{{{'|'.join(enabled_extractors())}}}",
+            "/jobs/generate/{summary|test}",
+            "/jobs/{job_id}",
+            f"/pipeline/{{{'|'.join(enabled_extractors())}}}",
+            "/metrics",
 
         ]
     }
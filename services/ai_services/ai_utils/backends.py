@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
+import itertools
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from .utils import AIResponse
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Порядок бэкендов; GENERATE_BACKEND оставлен для совместимости со старой настройкой
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", os.getenv("GENERATE_BACKEND", "openrouter"))
+# primary | fastest | round_robin | least_errors
+LLM_ROUTING_POLICY = os.getenv("LLM_ROUTING_POLICY", "primary")
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+# Дублирующий запрос отправляется, если первый дольше этого перцентиля своих задержек
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+# Задержка хеджирования, пока статистики недостаточно
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", 10.0))
+LLM_STATS_WINDOW = int(os.getenv("LLM_STATS_WINDOW", 200))
+
+# Ошибки, при которых имеет смысл попробовать другой бэкенд
+FAILOVER_STATUS_CODES = {408, 429}
+
+
+def is_failover_error(error: BaseException) -> bool:
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500 or error.status_code in FAILOVER_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+class Backend:
+    """One LLM provider with a rolling window of latency and error statistics."""
+
+    def __init__(
+        self,
+        name: str,
+        prompt: Callable[..., Awaitable[AIResponse]],
+        prompt_stream: Callable[..., AsyncIterator[Dict[str, Any]]],
+        window: int = LLM_STATS_WINDOW
+    ):
+        self.name = name
+        self.prompt = prompt
+        self.prompt_stream = prompt_stream
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)
+        self.stats = {"requests": 0, "errors": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0}
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.stats["requests"] += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.stats["errors"] += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(round(p / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "error_rate": self.error_rate,
+            "p50_seconds": self.percentile(50),
+            "p95_seconds": self.percentile(95),
+        }
+
+
+class BackendRouter:
+    """Routes prompts across backends with failover and optional hedged requests."""
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        policy: str = LLM_ROUTING_POLICY,
+        hedging: bool = LLM_HEDGING,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_default_delay: float = LLM_HEDGE_DEFAULT_DELAY
+    ):
+        if not backends:
+            raise ValueError("At least one LLM backend must be configured")
+        self.backends = backends
+        self.policy = policy
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self._round_robin = itertools.count()
+
+    def order(self) -> List[Backend]:
+        """Backends in the order they should be tried for the next call."""
+        if self.policy == "round_robin":
+            shift = next(self._round_robin) % len(self.backends)
+            return self.backends[shift:] + self.backends[:shift]
+        if self.policy == "fastest":
+            # Бэкенды без статистики идут первыми, чтобы ее набрать
+            return sorted(self.backends, key=lambda b: (b.percentile(50) or 0.0) + b.error_rate * 60)
+        if self.policy == "least_errors":
+            return sorted(self.backends, key=lambda b: b.error_rate)
+        return list(self.backends)
+
+    async def _call(self, backend: Backend, system_prompt: str, contents, use_cache: Optional[bool]) -> AIResponse:
+        started = time.monotonic()
+        try:
+            result = await backend.prompt(system_prompt=system_prompt, contents=contents, use_cache=use_cache)
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            backend.record(time.monotonic() - started, ok=False)
+            raise
+        backend.record(time.monotonic() - started, ok=True)
+        return result
+
+    async def _hedged(self, primary: Backend, secondary: Backend, system_prompt: str, contents,
+                      use_cache: Optional[bool], tried: Set[str]) -> AIResponse:
+        """Races primary against a delayed copy on secondary; secondary is added to `tried` once it is called."""
+        delay = primary.percentile(self.hedge_percentile) or self.hedge_default_delay
+        first = asyncio.create_task(self._call(primary, system_prompt, contents, use_cache))
+        pending = {first}
+        errors: Dict["asyncio.Task[AIResponse]", BaseException] = {}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            # Первый запрос медленнее обычного - дублируем его на второй бэкенд
+            secondary.stats["hedges"] += 1
+            tried.add(secondary.name)
+            second = asyncio.create_task(self._call(secondary, system_prompt, contents, use_cache))
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            secondary.stats["hedge_wins"] += 1
+                        return task.result()
+                    errors[task] = task.exception()
+            # Оба бэкенда ответили ошибкой: ошибка второго - последняя попытка, ошибка первого - ее причина
+            secondary.stats["failovers"] += 1
+            logger.warning(f"LLM backend {secondary.name} failed as a hedge ({errors[second]})")
+            raise errors[second] from errors[first]
+        finally:
+            # В том числе при отмене вызывающего, пока ждем первый бэкенд
+            for task in pending:
+                task.cancel()
+
+    async def prompt(self, system_prompt: str, contents, use_cache: Optional[bool] = None) -> AIResponse:
+        candidates = self.order()
+        # Бэкенды, уже получившие этот запрос (в том числе как хедж), повторно не вызываются
+        tried: Set[str] = set()
+        last_error: Optional[BaseException] = None
+        for index, backend in enumerate(candidates):
+            if backend.name in tried:
+                continue
+            tried.add(backend.name)
+            secondary = next((other for other in candidates[index + 1:] if other.name not in tried), None)
+            try:
+                if self.hedging and secondary is not None:
+                    return await self._hedged(backend, secondary, system_prompt, contents, use_cache, tried)
+                return await self._call(backend, system_prompt, contents, use_cache)
+            except Exception as e:
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+                backend.stats["failovers"] += 1
+                logger.warning(f"LLM backend {backend.name} failed ({e}), trying the next one")
+        raise last_error
+
+    async def prompt_stream(self, system_prompt: str, contents) -> AsyncIterator[Dict[str, Any]]:
+        """Streams from the first backend that produces an event; failover is only possible before that."""
+        candidates = self.order()
+        last_error: Optional[BaseException] = None
+        for backend in candidates:
+            started = time.monotonic()
+            events = backend.prompt_stream(system_prompt=system_prompt, contents=contents)
+            try:
+                first = await events.__anext__()
+            except StopAsyncIteration:
+                backend.record(time.monotonic() - started, ok=True)
+                return
+            except Exception as e:
+                backend.record(time.monotonic() - started, ok=False)
+                if not is_failover_error(e):
+                    raise
+                last_error = e
+                backend.stats["failovers"] += 1
+                logger.warning(f"LLM backend {backend.name} failed to start streaming ({e}), trying the next one")
+                continue
+
+            yield first
+            ok = False
+            try:
+                async for event in events:
+                    yield event
+                ok = True
+            finally:
+                backend.record(time.monotonic() - started, ok=ok)
+            return
+        raise last_error
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {backend.name: backend.get_stats() for backend in self.backends}
+
+
+# Бэкенд -> модуль (относительно ai_utils), функция запроса и функция потокового запроса.
+# Модуль импортируется при первом запросе к бэкенду, а не при старте приложения.
+BACKENDS: Dict[str, Tuple[str, str, str]] = {
+    "openrouter": (".openrouter_prompt", "openrouter_prompt", "openrouter_prompt_stream"),
+    "gemini": (".make_prompt", "make_prompt", "make_prompt_stream"),
+}
+
+
+def _lazy(module: str, name: str) -> Callable[..., Any]:
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module, __package__), name)(*args, **kwargs)
+
+    call.__name__ = name
+    return call
+
+
+def load_backend(name: str) -> Backend:
+    module, prompt, prompt_stream = BACKENDS[name]
+    return Backend(name, _lazy(module, prompt), _lazy(module, prompt_stream))
+
+
+def build_router_from_env() -> BackendRouter:
+    names = [name.strip() for name in LLM_BACKENDS.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown LLM backends in LLM_BACKENDS: {', '.join(unknown)}")
+    return BackendRouter([load_backend(name) for name in names])
+
+
+backend_router = build_router_from_env()
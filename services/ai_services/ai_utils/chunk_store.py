@@ -0,0 +1,46 @@
+import os
+import json
+import hashlib
+from typing import Optional
+from dotenv import load_dotenv
+from .http_client import settings
+from .backends import LLM_BACKENDS
+from .kv_store import SizeBoundedStore
+from .metrics import register_stats
+
+load_dotenv()
+
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "true").lower() == "true"
+CHUNK_STORE_PATH = os.getenv("CHUNK_STORE_PATH", ".cache/chunk_store.sqlite3")
+# Предельный объем частичных суммаризаций; при превышении удаляются давно не использованные
+CHUNK_STORE_MAX_MB = float(os.getenv("CHUNK_STORE_MAX_MB", 128))
+
+
+def chunk_key(chunk: str, language: str, system_prompt: str) -> str:
+    """A partial summary depends on the chunk text, the answer language, the model and the prompt."""
+    material = {
+        "chunk": hashlib.sha256(chunk.strip().encode("utf-8")).hexdigest(),
+        "language": language,
+        "backends": LLM_BACKENDS,
+        "model": settings.model,
+        "prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ChunkStore(SizeBoundedStore):
+    """
+    Частичные суммаризации кусков документа по хешу содержимого куска.
+
+    При повторной загрузке исправленного документа к модели уходят только новые
+    и измененные куски; суммаризации остальных берутся отсюда. Тот же принцип
+    действует для промежуточных уровней слияния.
+    """
+
+    def __init__(self, path: Optional[str] = CHUNK_STORE_PATH, max_mb: float = CHUNK_STORE_MAX_MB,
+                 enabled: bool = CHUNK_STORE_ENABLED):
+        super().__init__("Chunk store", path, table="chunks", column="summary", max_mb=max_mb, enabled=enabled)
+
+
+chunk_store = ChunkStore()
+register_stats("chunk_store", chunk_store.get_stats)
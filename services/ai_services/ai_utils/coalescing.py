@@ -0,0 +1,144 @@
+import os
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Одинаковые запросы, пришедшие пока первый еще выполняется, ждут его ответа, а не идут к провайдеру
+COALESCE_ENABLED = os.getenv("LLM_COALESCE_ENABLED", "true").lower() == "true"
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """One upstream stream whose events are buffered and replayed to every subscriber."""
+
+    def __init__(self, events: AsyncIterator[Dict[str, Any]]):
+        self.events = events
+        self.buffer: List[Dict[str, Any]] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    async def pump(self) -> None:
+        try:
+            async for event in self.events:
+                async with self.changed:
+                    self.buffer.append(event)
+                    self.changed.notify_all()
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self.changed:
+                self.changed.notify_all()
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы к модели в один запрос к провайдеру.
+
+    Ключ - make_cache_key (бэкенд, параметры модели, системный промпт, содержимое).
+    Для потоковых запросов события общего потока раздаются всем подписчикам с начала.
+    Запрос к провайдеру отменяется, только когда ушли все ожидающие.
+    """
+
+    def __init__(self, enabled: bool = COALESCE_ENABLED):
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        self.stats = {
+            "calls": 0,
+            "coalesced": 0,
+            "stream_calls": 0,
+            "stream_coalesced": 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Awaits fn() or, if a call with the same key is already in flight, its result."""
+        if not self.enabled:
+            return await fn()
+
+        self.stats["calls"] += 1
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+        else:
+            self.stats["coalesced"] += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Все ожидающие отменены - ответ больше никому не нужен
+                call.task.cancel()
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """Yields the events of factory() shared with concurrent subscribers of the same key."""
+        if not self.enabled:
+            async for event in factory():
+                yield event
+            return
+
+        self.stats["stream_calls"] += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream(factory())
+            self._streams[key] = shared
+            shared.task = asyncio.ensure_future(shared.pump())
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        else:
+            self.stats["stream_coalesced"] += 1
+
+        shared.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with shared.changed:
+                    await shared.changed.wait_for(lambda: index < len(shared.buffer) or shared.done)
+                    if index < len(shared.buffer):
+                        event = shared.buffer[index]
+                        index += 1
+                    elif shared.error is not None:
+                        raise shared.error
+                    else:
+                        return
+                # Подписчики изменяют события (streaming._relay), поэтому каждому - своя копия
+                yield dict(event)
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.task.done():
+                shared.task.cancel()
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, entry: Any) -> None:
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+        }
+
+
+single_flight = SingleFlight()
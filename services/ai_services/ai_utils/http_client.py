@@ -0,0 +1,145 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+import httpx
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+class OpenRouterSettings(BaseModel):
+    """Upstream settings read once from the environment instead of on every call."""
+    api_key: Optional[str] = None
+    base_url: str = "https://openrouter.ai/api/v1"
+    model: Optional[str] = None
+    temperature: float = 0.7
+    max_tokens: int = 1024
+    # Размер контекста модели: запрос плюс ответ
+    context_tokens: int = 32768
+    top_p: float = 0.9
+    site_url: str = "https://yoursite.com"
+    app_name: str = "AI Service"
+
+    # Пул соединений
+    http2: bool = True
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    warmup_connections: int = 2
+
+    # Таймауты по фазам запроса
+    connect_timeout: float = 10.0
+    read_timeout: float = 60.0
+    write_timeout: float = 30.0
+    pool_timeout: float = 10.0
+
+    @property
+    def chat_completions_url(self) -> str:
+        return f"{self.base_url.rstrip('/')}/chat/completions"
+
+    @classmethod
+    def from_env(cls) -> "OpenRouterSettings":
+        return cls(
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+            model=os.getenv("OPENROUTER_MODEL"),
+            temperature=float(os.getenv("TEMPERATURE", 0.7)),
+            max_tokens=int(os.getenv("MAX_TOKENS", 1024)),
+            context_tokens=int(os.getenv("OPENROUTER_CONTEXT_TOKENS", 32768)),
+            top_p=float(os.getenv("TOP_P", 0.9)),
+            site_url=os.getenv("SITE_URL", "https://yoursite.com"),
+            app_name=os.getenv("APP_NAME", "AI Service"),
+            http2=os.getenv("OPENROUTER_HTTP2", "true").lower() == "true",
+            max_connections=int(os.getenv("OPENROUTER_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.getenv("OPENROUTER_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", 30.0)),
+            warmup_connections=int(os.getenv("OPENROUTER_WARMUP_CONNECTIONS", 2)),
+            connect_timeout=float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", 10.0)),
+            read_timeout=float(os.getenv("OPENROUTER_READ_TIMEOUT", 60.0)),
+            write_timeout=float(os.getenv("OPENROUTER_WRITE_TIMEOUT", 30.0)),
+            pool_timeout=float(os.getenv("OPENROUTER_POOL_TIMEOUT", 10.0)),
+        )
+
+    def build_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": self.site_url,  # Required by OpenRouter
+            "X-Title": self.app_name  # Optional but recommended
+        }
+
+
+settings = OpenRouterSettings.from_env()
+headers = settings.build_headers()
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    http2 = settings.http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("h2 package is not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        headers=headers,
+        limits=httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.connect_timeout,
+            read=settings.read_timeout,
+            write=settings.write_timeout,
+            pool=settings.pool_timeout,
+        ),
+        transport=transport,
+    )
+
+
+async def _warmup(client: httpx.AsyncClient) -> None:
+    """Opens keep-alive connections up front so the first user request skips the TCP/TLS handshake."""
+    if settings.warmup_connections <= 0:
+        return
+    # Параллельные запросы, чтобы пул открыл несколько соединений, а не переиспользовал одно
+    results = await asyncio.gather(
+        *(client.head(settings.base_url) for _ in range(settings.warmup_connections)),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"OpenRouter connection warmup failed: {result}")
+            return
+
+
+async def init_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Creates the app-wide client. Called from the FastAPI lifespan in server.py."""
+    global _client
+    if _client is None:
+        _client = _build_client(transport)
+        await _warmup(_client)
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it lazily when running outside the app lifespan."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
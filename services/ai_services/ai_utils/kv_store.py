@@ -0,0 +1,139 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# После вытеснения хранилище занимает не больше этой доли предела, чтобы не чистить его на каждой записи
+EVICT_TO = 0.9
+# Ограничение SQLite на число параметров запроса
+_BATCH = 500
+
+
+class SizeBoundedStore:
+    """
+    Persistent text-by-key store in SQLite (WAL) with size-based LRU eviction.
+
+    Several processes (serve.py) may share one file, so the size is always read
+    from the database. Errors are logged and treated as misses.
+    """
+
+    def __init__(self, label: str, path: Optional[str], table: str, column: str, max_mb: float, enabled: bool):
+        self.label = label
+        self.path = path
+        self.table = table
+        self.column = column
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._size_bytes = 0
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+        }
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"key TEXT PRIMARY KEY, {self.column} TEXT NOT NULL, size INTEGER NOT NULL, "
+                f"created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_last_used_at ON {self.table}(last_used_at)"
+            )
+            self._conn.commit()
+            (self._size_bytes,) = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        return self._conn
+
+    def _get_many(self, keys: List[str]) -> Dict[str, str]:
+        with self._lock:
+            conn = self._get_conn()
+            found: Dict[str, str] = {}
+            for start in range(0, len(keys), _BATCH):
+                batch = keys[start:start + _BATCH]
+                found.update(conn.execute(
+                    f"SELECT key, {self.column} FROM {self.table} WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            hits = list(found)
+            for start in range(0, len(hits), _BATCH):
+                batch = hits[start:start + _BATCH]
+                conn.execute(
+                    f"UPDATE {self.table} SET last_used_at = ? WHERE key IN ({','.join('?' * len(batch))})",
+                    [time.time(), *batch]
+                )
+            if hits:
+                conn.commit()
+        return found
+
+    def _set_many(self, items: Dict[str, str]) -> None:
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, {self.column}, size, created_at, last_used_at) "
+                f"VALUES (?, ?, ?, ?, ?)",
+                [(key, value, len(value.encode("utf-8")), now, now) for key, value in items.items()]
+            )
+            (self._size_bytes,) = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+            if self._size_bytes > self.max_bytes:
+                self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        target = int(self.max_bytes * EVICT_TO)
+        evicted = []
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_used_at").fetchall():
+            if self._size_bytes <= target:
+                break
+            evicted.append(key)
+            self._size_bytes -= size
+            self.stats["evicted_bytes"] += size
+        for start in range(0, len(evicted), _BATCH):
+            batch = evicted[start:start + _BATCH]
+            conn.execute(f"DELETE FROM {self.table} WHERE key IN ({','.join('?' * len(batch))})", batch)
+        self.stats["evictions"] += len(evicted)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, str]:
+        """Returns {key: value} for the stored keys; lookup errors count as misses."""
+        if not self.enabled or not keys:
+            return {}
+        try:
+            found = await asyncio.to_thread(self._get_many, keys)
+        except sqlite3.Error as e:
+            logger.warning(f"{self.label} read failed: {e}")
+            found = {}
+        self.stats["lookups"] += len(keys)
+        self.stats["hits"] += len(found)
+        self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    async def set_many(self, items: Dict[str, str]) -> None:
+        if not self.enabled or not items:
+            return
+        try:
+            await asyncio.to_thread(self._set_many, items)
+            self.stats["stores"] += len(items)
+        except sqlite3.Error as e:
+            logger.warning(f"{self.label} write failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "size_bytes": self._size_bytes,
+            "hit_rate": self.stats["hits"] / self.stats["lookups"] if self.stats["lookups"] else 0.0,
+        }
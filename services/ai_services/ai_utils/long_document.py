@@ -0,0 +1,255 @@
+import os
+import re
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from .utils import AIResponse
+from .backends import backend_router
+from .token_budget import token_estimator
+from .chunk_store import chunk_store, chunk_key
+from .system_prompts import get_summary_sys_prompt, get_merge_summary_sys_prompt
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Размер куска в символах (~4 символа на токен)
+CHUNK_CHARS = int(os.getenv("LONG_DOC_CHUNK_CHARS", 12000))
+# Тексты длиннее порога суммаризируются по схеме map-reduce
+LONG_DOC_THRESHOLD_CHARS = int(os.getenv("LONG_DOC_THRESHOLD_CHARS", CHUNK_CHARS))
+# Одновременных запросов к модели на один документ
+MAP_CONCURRENCY = int(os.getenv("LONG_DOC_CONCURRENCY", 4))
+# Средний размер куска как доля CHUNK_CHARS. Границы кусков зависят от содержимого, а не от позиции,
+# поэтому правка документа меняет только соседние куски
+CHUNK_TARGET_RATIO = float(os.getenv("LONG_DOC_CHUNK_TARGET_RATIO", 0.6))
+# Куски короче этой доли CHUNK_CHARS не обрываются на границе по содержимому
+CHUNK_MIN_RATIO = 0.25
+
+PromptFn = Callable[..., Awaitable[AIResponse]]
+
+# Элементы, которые выдает get_text_from_docx
+_ELEMENT_RE = re.compile(r"<(text|table|formula)>.*?</\1>", re.DOTALL)
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# Корневой тег документа из get_text_from_docx - не содержимое
+_ROOT_TAG_RE = re.compile(r"</?extracted_text>")
+
+
+def _paragraphs(text: str) -> List[str]:
+    return [p for p in _PARAGRAPH_RE.split(_ROOT_TAG_RE.sub("", text)) if p.strip()]
+
+
+def _split_units(text: str) -> List[str]:
+    """
+    Splits text on structural boundaries: XML elements are units of their own,
+    text outside them (prose around an inline <formula>) is split into paragraphs.
+    """
+    units = []
+    position = 0
+    for match in _ELEMENT_RE.finditer(text):
+        units.extend(_paragraphs(text[position:match.start()]))
+        units.append(match.group(0))
+        position = match.end()
+    units.extend(_paragraphs(text[position:]))
+    return units
+
+
+def _hard_split(unit: str, max_chars: int) -> List[str]:
+    """Splits a unit that alone exceeds the chunk size, preferring line and sentence breaks."""
+    pieces = []
+    while len(unit) > max_chars:
+        cut = max(unit.rfind("\n", 0, max_chars), unit.rfind(". ", 0, max_chars))
+        if cut <= 0:
+            cut = max_chars
+        else:
+            cut += 1
+        pieces.append(unit[:cut])
+        unit = unit[cut:]
+    if unit.strip():
+        pieces.append(unit)
+    return pieces
+
+
+def _is_boundary(unit: str, target_chars: int) -> bool:
+    """Content-defined cut after `unit`, with probability proportional to its length (~1 per target_chars)."""
+    value = int.from_bytes(hashlib.sha256(unit.encode("utf-8")).digest()[:8], "big") / 2 ** 64
+    return value < len(unit) / target_chars
+
+
+def _pack(units: List[str], max_chars: int, separator: str = "\n") -> List[str]:
+    """
+    Packs units into chunks of at most max_chars, cutting where the content says so
+    rather than where the previous chunk filled up.
+
+    After an insertion or deletion the boundaries downstream re-synchronize at the next
+    content-defined cut, so unchanged parts of a revised document produce the same chunks.
+    """
+    target = max(int(max_chars * CHUNK_TARGET_RATIO), 1)
+    min_chars = int(max_chars * CHUNK_MIN_RATIO)
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for unit in units:
+        if size and size + len(separator) + len(unit) > max_chars:
+            chunks.append(separator.join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += len(unit) + (len(separator) if len(current) > 1 else 0)
+        if size >= min_chars and _is_boundary(unit, target):
+            chunks.append(separator.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def split_text(text: str, max_chars: int = CHUNK_CHARS) -> List[str]:
+    """
+    Разбивает текст на куски не длиннее max_chars по структурным границам.
+
+    Args:
+        text: Исходный текст или XML из get_text_from_docx
+        max_chars: Максимальная длина куска в символах
+
+    Returns:
+        Список кусков в порядке следования в тексте; границы определяются содержимым,
+        так что неизмененные части исправленного документа дают те же куски
+    """
+    units = []
+    for unit in _split_units(text):
+        units.extend(_hard_split(unit, max_chars) if len(unit) > max_chars else [unit])
+    return _pack(units, max_chars)
+
+
+def _add_usage(total: Dict[str, int], raw_response: Dict[str, Any]) -> None:
+    usage = raw_response.get("usage") or {}
+    for key, value in usage.items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+
+
+async def _summarize_all(
+    system_prompt: str,
+    chunks: List[str],
+    prompt: PromptFn,
+    use_cache: Optional[bool],
+    usage: Dict[str, int],
+    language: str,
+    counts: Dict[str, int]
+) -> List[str]:
+    """
+    Summarizes chunks concurrently. Summaries of chunks seen before (same text, language
+    and prompt) come from the chunk store, and identical chunks are sent once.
+
+    Like the page cache, the chunk store does not depend on the sampling temperature:
+    a partial summary is an intermediate result, not the answer. It is skipped only with
+    CHUNK_STORE_ENABLED=false or use_cache=False.
+    """
+    keys = [chunk_key(chunk, language, system_prompt) for chunk in chunks]
+    reuse = chunk_store.enabled and use_cache is not False
+    stored = await chunk_store.get_many(list(set(keys))) if reuse else {}
+    pending = {key: chunk for key, chunk in zip(keys, chunks) if key not in stored}
+    counts["reused"] += len(chunks) - sum(key in pending for key in keys)
+    counts["summarized"] += len(pending)
+
+    semaphore = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    async def run(chunk: str) -> str:
+        async with semaphore:
+            result = await prompt(system_prompt=system_prompt, contents=chunk, use_cache=use_cache)
+        _add_usage(usage, result.raw_response)
+        return result.response.strip()
+
+    summaries = dict(zip(pending, await asyncio.gather(*(run(chunk) for chunk in pending.values()))))
+    if reuse:
+        await chunk_store.set_many(summaries)
+    return [stored[key] if key in stored else summaries[key] for key in keys]
+
+
+async def reduce_partial_summaries(
+    text: str,
+    language: str,
+    prompt: PromptFn = backend_router.prompt,
+    use_cache: Optional[bool] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Map phase plus intermediate reduce levels of a long-document summary.
+
+    Summarizes chunks concurrently, then merges groups of partial summaries
+    until they fit into a single final merge call. Chunks and merge groups already
+    in the chunk store are not sent again, so re-summarizing a revised document
+    costs in proportion to the edit.
+
+    Returns:
+        Partial summaries joined for the final merge call and map-reduce stats
+    """
+    usage: Dict[str, int] = {}
+    # Кусок должен помещаться в контекст модели вместе с промптом и полным ответом
+    chunk_chars = min(CHUNK_CHARS, max(token_estimator.max_input_chars(get_summary_sys_prompt(language)), 1000))
+    chunks = split_text(text, chunk_chars)
+    logger.info(f"Long document: {len(text)} chars split into {len(chunks)} chunks")
+
+    counts = {"reused": 0, "summarized": 0}
+    partials = await _summarize_all(get_summary_sys_prompt(language), chunks, prompt, use_cache, usage, language, counts)
+    chunks_reused = counts["reused"]
+
+    merge_prompt = get_merge_summary_sys_prompt(language)
+    levels = 0
+    # Группы тоже режутся по содержимому: измененная частичная суммаризация затрагивает одну группу
+    groups = _pack(partials, chunk_chars)
+    while len(groups) > 1:
+        levels += 1
+        partials = await _summarize_all(merge_prompt, groups, prompt, use_cache, usage, language, counts)
+        merged = _pack(partials, chunk_chars)
+        if len(merged) >= len(groups):
+            # Слияние не уменьшает объем - отдаем всё в финальный запрос как есть
+            groups = ["\n".join(merged)]
+            break
+        groups = merged
+
+    stats = {
+        "chunks": len(chunks),
+        "chunks_reused": chunks_reused,
+        # Запросы к модели на кусках и промежуточных слияниях, без финального
+        "calls": counts["summarized"],
+        "reduce_levels": levels + 1,
+        "usage": usage,
+    }
+    return groups[0] if groups else "", stats
+
+
+def is_long_text(text: str) -> bool:
+    # Помимо порога по символам: текст, который по оценке не влезает в контекст одним запросом
+    return len(text) > LONG_DOC_THRESHOLD_CHARS or len(text) > token_estimator.max_input_chars()
+
+
+async def summarize_text(
+    text: str,
+    language: str,
+    prompt: PromptFn = backend_router.prompt,
+    use_cache: Optional[bool] = None
+) -> AIResponse:
+    """
+    Суммаризирует текст одним запросом, а длинный текст - через map-reduce.
+
+    Args:
+        text: Текст для суммаризации
+        language: Язык ответа
+        prompt: Функция запроса к модели (по умолчанию backend_router.prompt)
+        use_cache: Флаг кэша, передается в prompt
+
+    Returns:
+        AIResponse с итоговой суммаризацией
+    """
+    if not is_long_text(text):
+        return await prompt(system_prompt=get_summary_sys_prompt(language), contents=text, use_cache=use_cache)
+
+    merged_input, stats = await reduce_partial_summaries(text, language, prompt, use_cache)
+    result = await prompt(system_prompt=get_merge_summary_sys_prompt(language), contents=merged_input, use_cache=use_cache)
+    _add_usage(stats["usage"], result.raw_response)
+
+    return AIResponse(
+        response=result.response,
+        raw_response={**result.raw_response, "map_reduce": stats}
+    )
@@ -1,39 +1,103 @@
 # ai_prompts/gemini_prompts.py
-import google.generativeai as genai
-from google.generativeai.types import GenerationConfig 
 from fastapi import HTTPException
 import traceback
+from functools import lru_cache
 from .utils import AIResponse, cast_response_to_dict
+from .response_cache import response_cache, make_cache_key
+from .metrics import observe_upstream, record_token_usage
+from .coalescing import single_flight
 from dotenv import load_dotenv
 import os
+from typing import Any, AsyncIterator, Dict, Optional
 
 load_dotenv()
-# Настройка клиента Gemin
-# Fix the API key configuration
-try:
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))  # Use os.getenv instead of config.get
-except Exception as e:
-    print(f"Ошибка конфигурации Gemini SDK: {e}")
-
-async def make_prompt(system_prompt: str, contents) -> AIResponse:
+
+@lru_cache(maxsize=1)
+def _genai():
+    """Imports and configures the Gemini SDK on first use: it is slow to import and most deployments never call it."""
+    import google.generativeai as genai
+
+    # Настройка клиента Gemini
     try:
-        model = genai.GenerativeModel(
-            model_name=os.getenv("MODEL"),
-            system_instruction=system_prompt,
-            generation_config=GenerationConfig(
-                temperature=float(os.getenv("TEMPERATURE")),
-                top_p=float(os.getenv("TOP_P")),
-                max_output_tokens=int(os.getenv("MAX_TOKENS")),  # Fix typo: ax_output_tokens → max_output_tokens
+        # GEMINI_API_ENDPOINT позволяет направить SDK на локальный стаб-сервер
+        if os.getenv("GEMINI_API_ENDPOINT"):
+            genai.configure(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                transport="rest",
+                client_options={"api_endpoint": os.getenv("GEMINI_API_ENDPOINT")}
             )
+        else:
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))  # Use os.getenv instead of config.get
+    except Exception as e:
+        print(f"Ошибка конфигурации Gemini SDK: {e}")
+    return genai
+
+def _build_model(system_prompt: str):
+    genai = _genai()
+    from google.generativeai.types import GenerationConfig
+
+    return genai.GenerativeModel(
+        model_name=os.getenv("MODEL"),
+        system_instruction=system_prompt,
+        generation_config=GenerationConfig(
+            temperature=float(os.getenv("TEMPERATURE")),
+            top_p=float(os.getenv("TOP_P")),
+            max_output_tokens=int(os.getenv("MAX_TOKENS")),  # Fix typo: ax_output_tokens → max_output_tokens
+        )
+    )
+
+def _model_params() -> Dict[str, Any]:
+    return {
+        "model": os.getenv("MODEL"),
+        "temperature": float(os.getenv("TEMPERATURE")),
+        "top_p": float(os.getenv("TOP_P")),
+        "max_tokens": int(os.getenv("MAX_TOKENS")),
+    }
+
+def _checked_model_params() -> Dict[str, Any]:
+    """_model_params outside the request's try: missing or invalid settings fail with HTTP 500, as in _make_prompt."""
+    try:
+        return _model_params()
+    except Exception as e:
+        print(f"Ошибка конфигурации Gemini: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка взаимодействия с Gemini API: {str(e)}"
         )
 
-        response = await model.generate_content_async(contents)
+async def make_prompt(system_prompt: str, contents, use_cache: Optional[bool] = None) -> AIResponse:
+    # Одинаковые одновременные запросы идут к Gemini один раз; политика кэша входит в ключ, как у OpenRouter
+    key = ""
+    if single_flight.enabled:
+        params = _checked_model_params()
+        cached = response_cache.should_cache(params["temperature"], use_cache)
+        key = make_cache_key("gemini", {**params, "cached": cached}, system_prompt, contents)
+    return await single_flight.do(key, lambda: _make_prompt(system_prompt, contents, use_cache))
+
+async def _make_prompt(system_prompt: str, contents, use_cache: Optional[bool] = None) -> AIResponse:
+    try:
+        params = _model_params()
+        cache_key = None
+        if response_cache.should_cache(params["temperature"], use_cache):
+            cache_key = make_cache_key("gemini", params, system_prompt, contents)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        model = _build_model(system_prompt)
+
+        with observe_upstream("gemini"):
+            response = await model.generate_content_async(contents)
         response_text = response.text  # Extract text from response
 
-        return AIResponse(
+        result = AIResponse(
             response=response_text,
             raw_response=cast_response_to_dict(response=response)
         )
+        record_token_usage("gemini", result.raw_response.get("result", {}).get("usage_metadata"))
+        if cache_key is not None:
+            await response_cache.set(cache_key, result)
+        return result
 
     except Exception as e:
         print(f"Ошибка при запросе к Gemini API: {e}")
@@ -41,4 +105,45 @@ async def make_prompt(system_prompt: str, contents) -> AIResponse:
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка взаимодействия с Gemini API: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+async def make_prompt_stream(system_prompt: str, contents) -> AsyncIterator[Dict[str, Any]]:
+    """Gemini counterpart of openrouter_prompt_stream, emitting the same event shapes."""
+    # Ключ считается при первом чтении потока: ошибка настроек приходит туда же, где ошибки запроса
+    key = make_cache_key("gemini_stream", _checked_model_params(), system_prompt, contents) if single_flight.enabled else ""
+    async for event in single_flight.stream(key, lambda: _make_prompt_stream(system_prompt, contents)):
+        yield event
+
+async def _make_prompt_stream(system_prompt: str, contents) -> AsyncIterator[Dict[str, Any]]:
+    try:
+        model = _build_model(system_prompt)
+        with observe_upstream("gemini"):
+            response = await model.generate_content_async(contents, stream=True)
+
+        async for chunk in response:
+            # Чанк может не содержать текста (например, только safety-метаданные)
+            text = "".join(part.text for part in chunk.parts if hasattr(part, "text"))
+            if text:
+                yield {"type": "delta", "text": text}
+
+        finish_reason = None
+        if response.candidates:
+            finish_reason = str(response.candidates[0].finish_reason)
+        usage = None
+        if getattr(response, "usage_metadata", None):
+            usage = {
+                "prompt_token_count": response.usage_metadata.prompt_token_count,
+                "candidates_token_count": response.usage_metadata.candidates_token_count,
+                "total_token_count": response.usage_metadata.total_token_count
+            }
+        record_token_usage("gemini", usage)
+        yield {"type": "done", "finish_reason": finish_reason, "usage": usage}
+
+    except Exception as e:
+        print(f"Ошибка при потоковом запросе к Gemini API: {e}")
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Ошибка взаимодействия с Gemini API: {str(e)}"
+        )
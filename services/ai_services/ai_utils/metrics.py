@@ -0,0 +1,152 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+from starlette.routing import Match
+
+# Эндпоинт текущего запроса, выставляется middleware и читается стадиями внутри обработчиков
+current_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar("current_endpoint", default="background")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    "autosummary_request_duration_seconds",
+    "End-to-end HTTP request latency",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "autosummary_stage_duration_seconds",
+    "Latency of a processing stage inside a request",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "autosummary_requests_in_flight",
+    "HTTP requests currently being processed",
+    ["endpoint"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "autosummary_upstream_requests_in_flight",
+    "LLM requests currently waiting for the provider",
+    ["backend"],
+)
+LLM_TOKENS = Counter(
+    "autosummary_llm_tokens_total",
+    "Tokens reported by the LLM provider",
+    ["backend", "kind"],
+)
+
+
+def observe_stage_seconds(stage: str, seconds: float) -> None:
+    STAGE_LATENCY.labels(endpoint=current_endpoint.get(), stage=stage).observe(seconds)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    """Records the duration of the wrapped block as `stage` of the current endpoint."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage_seconds(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def observe_upstream(backend: str) -> Iterator[None]:
+    UPSTREAM_IN_FLIGHT.labels(backend=backend).inc()
+    try:
+        with observe_stage("upstream_request"):
+            yield
+    finally:
+        UPSTREAM_IN_FLIGHT.labels(backend=backend).dec()
+
+
+def record_token_usage(backend: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Counts prompt/completion tokens from an OpenRouter `usage` or Gemini `usage_metadata` dict."""
+    if not usage:
+        return
+    prompt_tokens = usage.get("prompt_tokens", usage.get("prompt_token_count"))
+    completion_tokens = usage.get("completion_tokens", usage.get("candidates_token_count"))
+    if isinstance(prompt_tokens, int):
+        LLM_TOKENS.labels(backend=backend, kind="prompt").inc(prompt_tokens)
+    if isinstance(completion_tokens, int):
+        LLM_TOKENS.labels(backend=backend, kind="completion").inc(completion_tokens)
+
+
+class TimedJSONResponse(JSONResponse):
+    """Default response class that records JSON rendering as the response_serialization stage."""
+
+    def render(self, content: Any) -> bytes:
+        with observe_stage("response_serialization"):
+            return super().render(content)
+
+
+def _route_path(request: Request) -> str:
+    # Шаблон пути (/jobs/{job_id}), а не сам путь, чтобы не раздувать число меток
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+async def metrics_middleware(request: Request, call_next):
+    endpoint = _route_path(request)
+    token = current_endpoint.set(endpoint)
+    IN_FLIGHT.labels(endpoint=endpoint).inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Для потоковых ответов это время до начала отправки тела
+        REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method, status=str(status)).observe(
+            time.perf_counter() - started
+        )
+        IN_FLIGHT.labels(endpoint=endpoint).dec()
+        current_endpoint.reset(token)
+
+
+class StatsCollector:
+    """Exposes the counters that modules keep in plain dicts (cache, pools, limiter) as gauges."""
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def register(self, name: str, source: Callable[[], Dict[str, Any]]) -> None:
+        self._sources[name] = source
+
+    def collect(self):
+        for name, source in self._sources.items():
+            for key, value in _flatten(source()).items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = GaugeMetricFamily(f"autosummary_{name}_{key}", f"{name} {key.replace('_', ' ')}")
+                metric.add_metric([], value)
+                yield metric
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}_"))
+        else:
+            flat[name] = value
+    return flat
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(name: str, source: Callable[[], Dict[str, Any]]) -> None:
+    stats_collector.register(name, source)
@@ -1,59 +1,85 @@
-import os
 import httpx
 import json
 import traceback
+from typing import Any, AsyncIterator, Dict, Optional
 from fastapi import HTTPException
-from dotenv import load_dotenv
 from .utils import AIResponse
+from .http_client import settings, get_http_client
+from .response_cache import response_cache, make_cache_key
+from .rate_limit import upstream_limiter
+from .metrics import observe_upstream, record_token_usage
+from .token_budget import token_estimator, context_overflow_error
+from .coalescing import single_flight
 
-load_dotenv()
+# Static part of every request body, built once at import time
+base_payload = {
+    "model": settings.model,
+    "temperature": settings.temperature,
+    "max_tokens": settings.max_tokens,
+    "top_p": settings.top_p
+}
 
-async def openrouter_prompt(system_prompt: str, contents) -> AIResponse:
+async def openrouter_prompt(system_prompt: str, contents, use_cache: Optional[bool] = None) -> AIResponse:
+    # Одинаковые одновременные запросы (общий документ у всей группы) идут к провайдеру один раз.
+    # Политика кэша входит в ключ: запрос в обход кэша не получает ответ, взятый из кэша
+    cached = response_cache.should_cache(settings.temperature, use_cache)
+    key = make_cache_key("openrouter", {**base_payload, "cached": cached}, system_prompt, contents) if single_flight.enabled else ""
+    return await single_flight.do(key, lambda: _openrouter_prompt(system_prompt, contents, use_cache))
+
+async def _openrouter_prompt(system_prompt: str, contents, use_cache: Optional[bool] = None) -> AIResponse:
     try:
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
+        if not settings.api_key:
             raise ValueError("OPENROUTER_API_KEY environment variable is not set")
         
+        # Оценка размера до отправки: max_tokens из оставшегося контекста, переполнение - сразу 413
+        plan = token_estimator.plan(system_prompt, contents)
+        if not plan.fits:
+            raise context_overflow_error(plan)
+        params = {**base_payload, "max_tokens": plan.max_tokens}
+        
+        cache_key = None
+        if response_cache.should_cache(settings.temperature, use_cache):
+            cache_key = make_cache_key("openrouter", params, system_prompt, contents)
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         # Prepare the request payload
         payload = {
-            "model": os.getenv("OPENROUTER_MODEL"),  # Default model if not specified
+            **params,
             "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": contents}
             ],
-            "temperature": float(os.getenv("TEMPERATURE", 0.7)),
-            "max_tokens": int(os.getenv("MAX_TOKENS", 1024)),
-            "top_p": float(os.getenv("TOP_P", 0.9))
-        }
-        
-        # Set up headers with API key
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": os.getenv("SITE_URL", "https://yoursite.com"),  # Required by OpenRouter
-            "X-Title": os.getenv("APP_NAME", "AI Service")  # Optional but recommended
         }
         
-        # Make the API request
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            
-            # Check if the request was successful
-            response.raise_for_status()
-            response_data = response.json()
-            
-            # Extract the response text
-            response_text = response_data["choices"][0]["message"]["content"] if "choices" in response_data else ""
-            
-            return AIResponse(
-                response=response_text,
-                raw_response=response_data
+        # Make the API request through the shared pooled client, under the client-side quota
+        client = get_http_client()
+        with observe_upstream("openrouter"):
+            response = await upstream_limiter.send(
+                plan.quota_tokens, lambda: client.post(settings.chat_completions_url, json=payload)
             )
+        
+        # Check if the request was successful
+        response.raise_for_status()
+        response_data = response.json()
+        record_token_usage("openrouter", response_data.get("usage"))
+        
+        # Extract the response text
+        response_text = response_data["choices"][0]["message"]["content"] if "choices" in response_data else ""
+        finish_reason = response_data["choices"][0].get("finish_reason") if response_data.get("choices") else None
+        token_estimator.record(plan, response_data.get("usage"), finish_reason)
+        
+        result = AIResponse(
+            response=response_text,
+            raw_response=response_data
+        )
+        if cache_key is not None:
+            await response_cache.set(cache_key, result)
+        return result
             
+    except HTTPException:
+        raise
     except ValueError as ve:
         print(f"Configuration error: {ve}")
         traceback.print_exc()
@@ -74,4 +100,95 @@ async def openrouter_prompt(system_prompt: str, contents) -> AIResponse:
         raise HTTPException(
             status_code=500,
             detail=f"Error interacting with OpenRouter API: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+def openrouter_prompt_stream(system_prompt: str, contents) -> AsyncIterator[Dict[str, Any]]:
+    """Relays upstream deltas as they arrive.
+
+    Yields {"type": "delta", "text": ...} events and a final
+    {"type": "done", "finish_reason": ..., "usage": ...} event.
+    Concurrent identical streams share one upstream request.
+    """
+    key = make_cache_key("openrouter_stream", base_payload, system_prompt, contents) if single_flight.enabled else ""
+    return single_flight.stream(key, lambda: _openrouter_prompt_stream(system_prompt, contents))
+
+async def _openrouter_prompt_stream(system_prompt: str, contents) -> AsyncIterator[Dict[str, Any]]:
+    if not settings.api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="OpenRouter API configuration error: OPENROUTER_API_KEY environment variable is not set"
+        )
+
+    plan = token_estimator.plan(system_prompt, contents)
+    if not plan.fits:
+        raise context_overflow_error(plan)
+
+    payload = {
+        **base_payload,
+        "max_tokens": plan.max_tokens,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": contents}
+        ],
+        "stream": True,
+        # Ask OpenRouter to append token usage to the last chunk
+        "stream_options": {"include_usage": True},
+    }
+
+    client = get_http_client()
+    try:
+        # В стадию upstream_request попадает время до заголовков ответа (первого байта)
+        with observe_upstream("openrouter"):
+            response = await upstream_limiter.send(
+                plan.quota_tokens,
+                lambda: client.send(client.build_request("POST", settings.chat_completions_url, json=payload), stream=True)
+            )
+        try:
+            if response.is_error:
+                await response.aread()
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"OpenRouter API error: {response.text}"
+                )
+
+            finish_reason = None
+            usage = None
+            async for line in response.aiter_lines():
+                # SSE: пропускаем пустые строки и комментарии (": OPENROUTER PROCESSING")
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise HTTPException(
+                        status_code=502,
+                        detail=f"OpenRouter API error: {chunk['error']}"
+                    )
+                if chunk.get("usage"):
+                    usage = chunk["usage"]
+                for choice in chunk.get("choices", []):
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield {"type": "delta", "text": text}
+                    if choice.get("finish_reason"):
+                        finish_reason = choice["finish_reason"]
+
+            record_token_usage("openrouter", usage)
+            token_estimator.record(plan, usage, finish_reason)
+            yield {"type": "done", "finish_reason": finish_reason, "usage": usage}
+
+        finally:
+            await response.aclose()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error when streaming from OpenRouter API: {e}")
+        traceback.print_exc()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error interacting with OpenRouter API: {str(e)}"
+        )
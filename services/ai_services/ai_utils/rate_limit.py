@@ -0,0 +1,254 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Квоты провайдера; 0 - без ограничения
+OPENROUTER_RPM = float(os.getenv("OPENROUTER_RPM", 0))
+OPENROUTER_TPM = float(os.getenv("OPENROUTER_TPM", 0))
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", 3))
+OPENROUTER_BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", 1.0))
+OPENROUTER_BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", 30.0))
+# Если задан, квоты хранятся в SQLite и общие для всех процессов (serve.py с несколькими воркерами)
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "")
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`; waiters are served in FIFO order."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Waits until `amount` tokens are available and takes them. Returns seconds spent waiting."""
+        # Запрос больше емкости иначе не прошел бы никогда
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+        return time.monotonic() - started
+
+    async def drain(self) -> None:
+        """Empties the bucket after the provider signals we are over quota."""
+        self.tokens = 0.0
+        self.updated_at = time.monotonic()
+
+
+class SharedTokenBucket:
+    """
+    Token bucket, состояние которого лежит в SQLite (WAL): все процессы на хосте расходуют одну квоту.
+
+    Пополнение и списание выполняются одной транзакцией BEGIN IMMEDIATE, поэтому процессы
+    не могут взять одни и те же токены. Внутри процесса ожидающие обслуживаются по очереди.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, path: str, capacity: Optional[float] = None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._lock = asyncio.Lock()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _update(self, take: float) -> float:
+        """Refills the shared bucket and takes `take` tokens if available. Returns seconds to wait, 0 if taken."""
+        with self._db_lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE name = ?", (self.name,)).fetchone()
+                now = time.time()
+                tokens = self.capacity if row is None else min(self.capacity, row[0] + max(now - row[1], 0.0) * self.rate)
+                wait = 0.0
+                if tokens >= take:
+                    tokens -= take
+                else:
+                    wait = (take - tokens) / self.rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                    (self.name, tokens, now)
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                wait = await asyncio.to_thread(self._update, amount)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        return time.monotonic() - started
+
+    def _drain(self) -> None:
+        with self._db_lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Время берется после получения блокировки, иначе ожидание засчиталось бы как пополнение
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, 0, ?)", (self.name, time.time())
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def drain(self) -> None:
+        # Запись ждет блокировку базы, пока ее держат другие процессы, - не в event loop
+        try:
+            await asyncio.to_thread(self._drain)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared rate limit drain failed: {e}")
+
+
+def make_bucket(name: str, rate_per_minute: float):
+    """In-process TokenBucket, or SharedTokenBucket when RATE_LIMIT_DB_PATH is set; None when unlimited."""
+    if rate_per_minute <= 0:
+        return None
+    if RATE_LIMIT_DB_PATH:
+        return SharedTokenBucket(name, rate_per_minute, RATE_LIMIT_DB_PATH)
+    return TokenBucket(rate_per_minute)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamLimiter:
+    """Client-side admission control (requests and tokens per minute) plus Retry-After aware retries."""
+
+    def __init__(self, rpm: float = OPENROUTER_RPM, tpm: float = OPENROUTER_TPM,
+                 max_retries: int = OPENROUTER_MAX_RETRIES, backoff_base: float = OPENROUTER_BACKOFF_BASE,
+                 backoff_max: float = OPENROUTER_BACKOFF_MAX):
+        self.requests = make_bucket("openrouter_requests", rpm)
+        self.tokens = make_bucket("openrouter_tokens", tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {
+            "admitted": 0,
+            "throttled": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "retries": 0,
+            "rate_limited_responses": 0,
+        }
+
+    async def acquire(self, estimated_tokens: int) -> float:
+        waited = 0.0
+        if self.requests is not None:
+            waited += await self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += await self.tokens.acquire(estimated_tokens)
+        self.stats["admitted"] += 1
+        if waited > 0.001:
+            self.stats["throttled"] += 1
+        self.stats["queue_wait_seconds_total"] += waited
+        self.stats["queue_wait_seconds_max"] = max(self.stats["queue_wait_seconds_max"], waited)
+        return waited
+
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            # Не раньше, чем просил провайдер; джиттер - чтобы ожидающие запросы не вернулись одновременно
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def send(self, estimated_tokens: int, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Отправляет запрос с учетом квот и повторяет его при 429/5xx и таймаутах.
+
+        Args:
+            estimated_tokens: Оценка токенов запроса для квоты TPM (TokenPlan.quota_tokens)
+            send: Функция, выполняющая один HTTP-запрос
+
+        Returns:
+            Ответ последней попытки (проверка статуса остается за вызывающим кодом)
+        """
+        attempt = 0
+        while True:
+            await self.acquire(estimated_tokens)
+            try:
+                response = await send()
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, None)
+                logger.warning(f"Upstream request failed ({e!r}), retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    self.stats["rate_limited_responses"] += 1
+                    # Провайдер считает, что квота исчерпана - не пускаем следующие запросы сразу
+                    if self.requests is not None:
+                        await self.requests.drain()
+                if retry_after is not None and retry_after > self.backoff_max:
+                    # Ждать дольше OPENROUTER_BACKOFF_MAX не будем, а повтор раньше срока снова получит отказ
+                    logger.warning(f"Upstream responded {response.status_code} with Retry-After {retry_after:.0f}s, "
+                                   f"not retrying")
+                    return response
+                delay = self.backoff(attempt, retry_after)
+                logger.warning(f"Upstream responded {response.status_code}, retrying in {delay:.1f}s")
+                await response.aclose()
+
+            attempt += 1
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+
+upstream_limiter = UpstreamLimiter()
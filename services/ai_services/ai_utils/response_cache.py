@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from .utils import AIResponse
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+# Кэшировать ли ответы при temperature > 0 (по умолчанию только детерминированные)
+CACHE_NONDETERMINISTIC = os.getenv("LLM_CACHE_NONDETERMINISTIC", "false").lower() == "true"
+MEMORY_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1024))
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+DISK_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+DISK_MAX_ENTRIES = int(os.getenv("LLM_CACHE_DISK_MAX_ENTRIES", 100000))
+
+
+def _normalize_text(text: str) -> str:
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _normalize_contents(contents: Any) -> Any:
+    """Turns prompt contents into a JSON-serializable form where images are replaced by their byte hash."""
+    if contents is None or isinstance(contents, (bool, int, float)):
+        return contents
+    if isinstance(contents, str):
+        if contents.startswith("data:") and ";base64," in contents:
+            return {"image_sha256": _digest(base64.b64decode(contents.split(";base64,", 1)[1]))}
+        return _normalize_text(contents)
+    if isinstance(contents, (bytes, bytearray, memoryview)):
+        return {"bytes_sha256": _digest(bytes(contents))}
+    if isinstance(contents, dict):
+        return {key: _normalize_contents(value) for key, value in sorted(contents.items())}
+    if isinstance(contents, (list, tuple)):
+        return [_normalize_contents(item) for item in contents]
+    if hasattr(contents, "tobytes") and hasattr(contents, "mode"):
+        # PIL.Image, который передается в Gemini напрямую
+        return {"image_sha256": _digest(contents.tobytes()), "mode": contents.mode, "size": list(contents.size)}
+    return _normalize_text(str(contents))
+
+
+def make_cache_key(backend: str, params: Dict[str, Any], system_prompt: str, contents: Any) -> str:
+    """Content-addressed key over the backend, model parameters, system prompt and contents.
+
+    Args:
+        backend: Backend name, e.g. "openrouter" or "gemini"
+        params: Model parameters (model, temperature, top_p, max_tokens)
+        system_prompt: System prompt text
+        contents: User contents, including image parts
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    material = {
+        "backend": backend,
+        "params": params,
+        "system_prompt": _normalize_text(system_prompt),
+        "contents": _normalize_contents(contents),
+    }
+    return _digest(json.dumps(material, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+
+class ResponseCache:
+    """Two-tier cache of LLM responses: in-process LRU with TTL in front of a SQLite store."""
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 disk_path: Optional[str] = DISK_CACHE_PATH, disk_max_entries: int = DISK_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._memory: "OrderedDict[str, Tuple[float, AIResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    def should_cache(self, temperature: float, use_cache: Optional[bool]) -> bool:
+        """Per-request flag wins; otherwise only deterministic settings are cached by default."""
+        if not CACHE_ENABLED or use_cache is False:
+            return False
+        if use_cache is True:
+            return True
+        return temperature == 0 or CACHE_NONDETERMINISTIC
+
+    # --- SQLite tier ---
+
+    def _get_conn(self) -> Optional[sqlite3.Connection]:
+        if not self.disk_path:
+            return None
+        if self._conn is None:
+            directory = os.path.dirname(self.disk_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False, timeout=10.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses(created_at)")
+            self._conn.commit()
+        return self._conn
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, AIResponse]]:
+        with self._lock:
+            conn = self._get_conn()
+            if conn is None:
+                return None
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                self.stats["expired"] += 1
+                return None
+        return expires_at, AIResponse.model_validate_json(value)
+
+    def _disk_set(self, key: str, response: AIResponse, expires_at: float) -> None:
+        with self._lock:
+            conn = self._get_conn()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, response.model_dump_json(), time.time(), expires_at)
+            )
+            # Ограничиваем размер диска: удаляем самые старые записи
+            (count,) = conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.disk_max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created_at LIMIT ?)",
+                    (overflow,)
+                )
+                self.stats["evictions"] += overflow
+            conn.commit()
+
+    # --- Memory tier ---
+
+    def _memory_put(self, key: str, expires_at: float, response: AIResponse) -> None:
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, key: str) -> Optional[AIResponse]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at >= time.time():
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return response
+            del self._memory[key]
+            self.stats["expired"] += 1
+
+        try:
+            entry = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk read failed: {e}")
+            entry = None
+        if entry is not None:
+            expires_at, response = entry
+            self._memory_put(key, expires_at, response)
+            self.stats["disk_hits"] += 1
+            return response
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: AIResponse) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._memory_put(key, expires_at, response)
+        self.stats["stores"] += 1
+        try:
+            await asyncio.to_thread(self._disk_set, key, response, expires_at)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache disk write failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
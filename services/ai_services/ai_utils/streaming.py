@@ -0,0 +1,47 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _relay(first: Dict[str, Any], events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    event = first
+    try:
+        while True:
+            event_type = event.pop("type")
+            yield format_sse(event_type, event)
+            event = await events.__anext__()
+    except StopAsyncIteration:
+        return
+    except HTTPException as he:
+        # Заголовки уже отправлены, поэтому ошибку можно передать только событием
+        logger.error(f"Upstream stream failed: {he.detail}")
+        yield format_sse("error", {"status_code": he.status_code, "detail": he.detail})
+    except Exception as e:
+        logger.error(f"Upstream stream failed: {e}", exc_info=True)
+        yield format_sse("error", {"status_code": 500, "detail": str(e)})
+
+
+async def stream_events(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Wraps backend stream events into a Server-Sent Events response.
+
+    The first event is awaited before the response starts, so configuration
+    and upstream HTTP errors still surface as regular HTTP error statuses.
+    """
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        first = {"type": "done", "finish_reason": None, "usage": None}
+
+    return StreamingResponse(
+        _relay(first, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
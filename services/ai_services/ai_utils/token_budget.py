@@ -0,0 +1,209 @@
+import io
+import os
+import math
+import base64
+import logging
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from .http_client import settings
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Начальная оценка символов на токен; уточняется по usage из ответов провайдера
+TOKEN_CHARS_PER_TOKEN = float(os.getenv("TOKEN_CHARS_PER_TOKEN", 4.0))
+# Доля контекста, оставляемая на ошибку оценки
+TOKEN_SAFETY_MARGIN = float(os.getenv("TOKEN_SAFETY_MARGIN", 0.05))
+# Если на ответ остается меньше, запрос не отправляется: ответ все равно был бы обрезан
+TOKEN_MIN_OUTPUT = int(os.getenv("TOKEN_MIN_OUTPUT", 256))
+# Вес нового наблюдения при калибровке (экспоненциальное среднее)
+TOKEN_CALIBRATION_ALPHA = float(os.getenv("TOKEN_CALIBRATION_ALPHA", 0.1))
+# Токены на изображение, если его размер не удалось прочитать
+TOKEN_IMAGE_DEFAULT = int(os.getenv("TOKEN_IMAGE_DEFAULT", 765))
+
+# Служебные токены на сообщение (роль, разделители)
+_MESSAGE_OVERHEAD = 4
+# Калибруемся только на запросах без изображений и с заметным объемом текста
+_MIN_CALIBRATION_CHARS = 200
+_CHARS_PER_TOKEN_RANGE = (1.0, 8.0)
+
+
+class TokenPlan(BaseModel):
+    """Estimated size of one request and the max_tokens chosen for it."""
+    prompt_tokens: int
+    text_chars: int
+    image_tokens: int
+    # Только текст: по таким запросам калибруется chars_per_token
+    text_only: bool = True
+    max_tokens: int
+    context_tokens: int
+    chars_per_token: float
+
+    @property
+    def fits(self) -> bool:
+        return self.max_tokens >= TOKEN_MIN_OUTPUT
+
+    @property
+    def quota_tokens(self) -> int:
+        """Upper bound the request can take from a tokens-per-minute quota."""
+        return self.prompt_tokens + self.max_tokens
+
+
+def image_tokens(url: str) -> int:
+    """
+    Оценка токенов изображения по схеме плиток 512x512 (как у OpenAI high detail):
+    изображение вписывается в 2048x2048, короткая сторона - в 768.
+    """
+    if not url.startswith("data:") or "," not in url:
+        return TOKEN_IMAGE_DEFAULT
+    from PIL import Image
+
+    # Для размера хватает заголовка: декодируем только начало
+    head = url.split(",", 1)[1][:65536]
+    try:
+        width, height = Image.open(io.BytesIO(base64.b64decode(head[:len(head) // 4 * 4]))).size
+    except Exception:
+        return TOKEN_IMAGE_DEFAULT
+
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def _content_size(contents: Any) -> Tuple[int, int, bool]:
+    """
+    Characters of text and estimated image tokens in a user message (string or list of parts),
+    and whether it is text only. Parts are either OpenAI-style ("text", "image_url" with {"url"})
+    or the ones get_png_payload builds ("input_text", "input_image" with a plain URL string).
+    """
+    if isinstance(contents, str):
+        return len(contents), 0, True
+    chars, images, text_only = 0, 0, True
+    for part in contents or []:
+        if isinstance(part, str):
+            chars += len(part)
+            continue
+        kind = part.get("type") if isinstance(part, dict) else None
+        if kind in ("text", "input_text"):
+            chars += len(part.get("text") or "")
+            continue
+        # Всё, что не текст (изображения, байты PDF для Gemini), исключает запрос из калибровки
+        text_only = False
+        if kind in ("image_url", "input_image"):
+            url = part.get("image_url")
+            images += image_tokens(url if isinstance(url, str) else (url or {}).get("url", ""))
+        else:
+            images += TOKEN_IMAGE_DEFAULT
+    return chars, images, text_only
+
+
+class TokenEstimator:
+    """
+    Локальная оценка размера запроса до отправки.
+
+    По оценке выбирается max_tokens из оставшегося контекста, а слишком большие
+    входы отклоняются или делятся заранее, а не после полного запроса к провайдеру.
+    """
+
+    def __init__(self, context_tokens: int, chars_per_token: float = TOKEN_CHARS_PER_TOKEN):
+        self.context_tokens = context_tokens
+        self.chars_per_token = chars_per_token
+        self.stats = {
+            "planned": 0,
+            "rejected": 0,
+            "max_tokens_reduced": 0,
+            "calibrations": 0,
+            "truncated": 0,
+            "abs_error_tokens_total": 0,
+            "actual_tokens_total": 0,
+        }
+
+    @property
+    def usable_context(self) -> int:
+        return int(self.context_tokens * (1 - TOKEN_SAFETY_MARGIN))
+
+    def text_tokens(self, chars: int) -> int:
+        return math.ceil(chars / self.chars_per_token)
+
+    def plan(self, system_prompt: str, contents: Any, max_tokens: Optional[int] = None) -> TokenPlan:
+        """
+        Оценивает запрос и выбирает для него max_tokens.
+
+        Args:
+            system_prompt: Системный промпт
+            contents: Содержимое пользовательского сообщения (строка или список частей)
+            max_tokens: Желаемый предел ответа (по умолчанию MAX_TOKENS)
+
+        Returns:
+            TokenPlan; plan.fits = False, если на ответ не остается TOKEN_MIN_OUTPUT токенов
+        """
+        max_tokens = max_tokens or settings.max_tokens
+        chars, images, text_only = _content_size(contents)
+        chars += len(system_prompt)
+        prompt_tokens = self.text_tokens(chars) + images + 2 * _MESSAGE_OVERHEAD
+        available = self.usable_context - prompt_tokens
+
+        self.stats["planned"] += 1
+        if available < max_tokens:
+            self.stats["max_tokens_reduced"] += 1
+        plan = TokenPlan(
+            prompt_tokens=prompt_tokens,
+            text_chars=chars,
+            image_tokens=images,
+            text_only=text_only,
+            max_tokens=max(min(max_tokens, available), 0),
+            context_tokens=self.context_tokens,
+            chars_per_token=self.chars_per_token,
+        )
+        if not plan.fits:
+            self.stats["rejected"] += 1
+        return plan
+
+    def max_input_chars(self, system_prompt: str = "", max_tokens: Optional[int] = None) -> int:
+        """How many characters of user text fit next to system_prompt with room for a full answer."""
+        reserved = (max_tokens or settings.max_tokens) + self.text_tokens(len(system_prompt)) + 2 * _MESSAGE_OVERHEAD
+        return max(int((self.usable_context - reserved) * self.chars_per_token), 0)
+
+    def record(self, plan: TokenPlan, usage: Optional[Dict[str, Any]], finish_reason: Optional[str] = None) -> None:
+        """Compares the estimate with the provider's usage and recalibrates chars per token."""
+        if finish_reason == "length":
+            self.stats["truncated"] += 1
+            logger.warning(f"Response truncated at max_tokens={plan.max_tokens} (estimated prompt {plan.prompt_tokens} tokens)")
+        actual = (usage or {}).get("prompt_tokens")
+        if not isinstance(actual, int) or actual <= 0:
+            return
+
+        self.stats["abs_error_tokens_total"] += abs(actual - plan.prompt_tokens)
+        self.stats["actual_tokens_total"] += actual
+        text_tokens = actual - 2 * _MESSAGE_OVERHEAD
+        if not plan.text_only or plan.image_tokens or plan.text_chars < _MIN_CALIBRATION_CHARS or text_tokens <= 0:
+            return
+        observed = min(max(plan.text_chars / text_tokens, _CHARS_PER_TOKEN_RANGE[0]), _CHARS_PER_TOKEN_RANGE[1])
+        self.chars_per_token += TOKEN_CALIBRATION_ALPHA * (observed - self.chars_per_token)
+        self.stats["calibrations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        actual = self.stats["actual_tokens_total"]
+        return {
+            **self.stats,
+            "chars_per_token": self.chars_per_token,
+            "context_tokens": self.context_tokens,
+            # Средняя относительная ошибка оценки prompt_tokens
+            "estimate_error_ratio": self.stats["abs_error_tokens_total"] / actual if actual else 0.0,
+        }
+
+
+token_estimator = TokenEstimator(settings.context_tokens)
+
+
+def context_overflow_error(plan: TokenPlan) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=(f"Input is too large for the model context: ~{plan.prompt_tokens} tokens estimated, "
+                f"context is {plan.context_tokens} tokens with at least {TOKEN_MIN_OUTPUT} reserved for the answer")
+    )
@@ -1,6 +1,9 @@
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, List, Literal, Optional
 from pydantic import BaseModel
-from google.generativeai.types import AsyncGenerateContentResponse
+
+if TYPE_CHECKING:
+    # Только для аннотации: сам google.generativeai грузится при первом запросе к Gemini
+    from google.generativeai.types import AsyncGenerateContentResponse
 
 class AIRequest(BaseModel):
     text: str
@@ -8,13 +11,29 @@ class AIRequest(BaseModel):
     additional_params: Optional[Dict[str, Any]] = None
     num_questions: int = 5
     language: str = "auto"
+    # None - политика кэша по умолчанию, False - обойти кэш, True - кэшировать принудительно
+    use_cache: Optional[bool] = None
+    # Только /generate/test без stream: вопросы берутся из заранее сгенерированного пула по этой суммаризации
+    question_pool: bool = False
 
 
 class AIResponse(BaseModel):
     response: str
     raw_response: Dict[str, Any] 
 
-def cast_response_to_dict(response: AsyncGenerateContentResponse) -> Dict[str, Any]:
+
+class BatchItem(AIRequest):
+    operation: Literal["summary", "test"]
+    # Идентификатор клиента, возвращается в строке результата
+    id: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    # Сколько элементов обрабатывать одновременно (ограничено BATCH_MAX_CONCURRENCY)
+    concurrency: Optional[int] = None
+
+def cast_response_to_dict(response: "AsyncGenerateContentResponse") -> Dict[str, Any]:
     """Преобразует AsyncGenerateContentResponse в словарь."""
     result = {}
     
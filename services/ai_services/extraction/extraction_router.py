@@ -7,7 +7,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 router = APIRouter(prefix="/extract", tags=["extract"])
 
-# Импортируем модули с маршрутами, чтобы они зарегистрировались
-from services.ai_services.extraction.formats import extract_png, extract_pdf, extract_doc
-# Здесь также нужно будет импортировать extract_pdf, когда он будет создан
-# from services.extraction.formats import extract_pdf
+# Импортируем модули с маршрутами включенных форматов, чтобы они зарегистрировались
+from services.ai_services.extraction.registry import load_extractor_routes
+
+load_extractor_routes()
@@ -2,35 +2,24 @@ from fastapi import HTTPException, UploadFile, File, Form
 from typing import List, Optional
 import logging
 # Switch back to absolute imports
-from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
-from services.ai_services.ai_utils.system_prompts import get_summary_sys_prompt
-from services.ai_services.extraction.formats.format_utils.format_utils import get_text_from_docx
+from services.ai_services.ai_utils.long_document import summarize_text
+from services.ai_services.extraction.formats.format_utils.format_utils import get_text_from_docx, DocumentSource
 from services.ai_services.ai_utils.utils import AIResponse
 from services.ai_services.extraction.extraction_router import router
 from services.ai_services.extraction.formats.format_utils.validators import validate_file, handle_extraction_error
+from services.ai_services.extraction.formats.format_utils.uploads import spool_upload
+from services.ai_services.extraction.formats.format_utils.cpu_pool import run_cpu_bound
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-@router.post("/doc", response_model=AIResponse)
-async def extract_doc(
-    file: UploadFile = File(...),
-    language: str = Form("auto"),
-    summarize: Optional[bool] = Form(False)
-):
+async def process_doc(source: DocumentSource, language: str = "auto", summarize: bool = False) -> AIResponse:
+    """Extracts (and optionally summarizes) a DOCX given as bytes or a spooled file path. Shared by /extract/doc and /jobs."""
     try:
-        # Валидация файла
-        validate_file(file, "doc")
-        
-        # Чтение содержимого файла
-        doc_bytes = await file.read() 
-
-        result = get_text_from_docx(doc_bytes)
+        result = await run_cpu_bound(get_text_from_docx, source)
 
         if(summarize):
-            return await openrouter_prompt(
-                system_prompt=get_summary_sys_prompt(language),
-                contents=result)
+            return await summarize_text(text=result, language=language)
 
         return AIResponse(
             response=result,
@@ -43,3 +32,16 @@ async def extract_doc(
     except Exception as e:
         handle_extraction_error(e, "doc")
 
+
+@router.post("/doc", response_model=AIResponse)
+async def extract_doc(
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):
+    # Валидация файла
+    validate_file(file, "doc")
+    
+    # Чтение содержимого файла кусками, большой файл сбрасывается на диск
+    with await spool_upload(file) as upload:
+        return await process_doc(upload.source, language=language, summarize=summarize)
@@ -1,15 +1,187 @@
 from fastapi import HTTPException, UploadFile, File, Form
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
+import os
 from services.ai_services.ai_utils.utils import AIResponse
 from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
+from services.ai_services.ai_utils.long_document import summarize_text
 from services.ai_services.ai_utils.system_prompts import get_extract_text_png_sys_prompt, get_extract_png_summary_sys_prompt
-from services.ai_services.extraction.formats.format_utils.format_utils import convert_pdf_to_images, get_png_payload
+from services.ai_services.extraction.formats.format_utils.format_utils import (
+    render_pdf_pages, get_png_payload, extract_pdf_text_layer, page_text_to_xml,
+    DocumentSource, PDF_PAGES_PER_REQUEST
+)
+from services.ai_services.extraction.formats.format_utils.page_cache import page_cache, extract_page_texts
+from services.ai_services.extraction.formats.format_utils.ocr import ocr_enabled
+from services.ai_services.extraction.formats.format_utils.cpu_pool import run_cpu_bound, cpu_request
+from services.ai_services.ai_utils.metrics import observe_stage_seconds
 from services.ai_services.extraction.formats.format_utils.validators import validate_file, handle_extraction_error
+from services.ai_services.extraction.formats.format_utils.uploads import spool_upload
 from services.ai_services.extraction.extraction_router import router
 
 logger = logging.getLogger(__name__)
 
+# Сколько пачек страниц одного документа одновременно находится в памяти и в запросах
+PDF_VISION_CONCURRENCY = int(os.getenv("PDF_VISION_CONCURRENCY", 2))
+
+
+def _image_page_runs(pages: Dict[int, Optional[str]]) -> List[Tuple[int, int]]:
+    """Groups pages without a text layer into contiguous (first, last) ranges for pdf2image."""
+    runs = []
+    for number, text in pages.items():
+        if text is not None:
+            continue
+        if runs and runs[-1][1] == number - 1:
+            runs[-1] = (runs[-1][0], number)
+        else:
+            runs.append((number, number))
+    return runs
+
+
+async def _render_pages(
+    source: DocumentSource,
+    first: int,
+    last: int,
+    for_ocr: bool = False
+) -> Tuple[List[str], List[str], Optional[List[str]]]:
+    # Растеризация идет в общем пуле процессов, а не в event loop
+    images, page_hashes, ocr_images, timings = await run_cpu_bound(
+        render_pdf_pages, source, first_page=first, last_page=last, for_ocr=for_ocr
+    )
+    for stage, seconds in timings.items():
+        observe_stage_seconds(stage, seconds)
+    return images, page_hashes, ocr_images
+
+
+def _split_batches(runs: List[Tuple[int, int]], batch_size: int = PDF_PAGES_PER_REQUEST) -> List[Tuple[int, int]]:
+    batches = []
+    for first, last in runs:
+        for start in range(first, last + 1, batch_size):
+            batches.append((start, min(start + batch_size - 1, last)))
+    return batches
+
+
+async def _extract_batches(
+    source: DocumentSource,
+    runs: List[Tuple[int, int]],
+    language: str
+) -> Tuple[Dict[int, Tuple[Optional[str], str]], List[AIResponse]]:
+    """
+    Растеризует страницы пачками по PDF_PAGES_PER_REQUEST и извлекает их текст через кэш страниц.
+
+    Следующая пачка растеризуется только после освобождения слота семафора,
+    поэтому в памяти не больше PDF_VISION_CONCURRENCY пачек независимо от размера PDF.
+
+    Returns:
+        Словарь {номер страницы: (текст, источник)} и ответы vision-модели
+    """
+    semaphore = asyncio.Semaphore(PDF_VISION_CONCURRENCY)
+    tasks = {}
+
+    async def call(first: int, last: int):
+        try:
+            # OCR получает страницы в исходном разрешении без потерь, vision-модель - уменьшенные
+            images, page_hashes, ocr_images = await _render_pages(source, first, last, for_ocr=ocr_enabled())
+            return await extract_page_texts(images, page_hashes, language, ocr_images=ocr_images)
+        finally:
+            semaphore.release()
+
+    try:
+        for first, last in _split_batches(runs):
+            await semaphore.acquire()
+            tasks[first] = asyncio.create_task(call(first, last))
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    pages: Dict[int, Tuple[Optional[str], str]] = {}
+    responses: List[AIResponse] = []
+    for first, (texts, sources, batch_responses) in zip(tasks.keys(), results):
+        for offset, (text, page_source) in enumerate(zip(texts, sources)):
+            pages[first + offset] = (text, page_source)
+        responses.extend(batch_responses)
+    return pages, responses
+
+
+async def process_pdf(
+    source: DocumentSource,
+    language: str = "auto",
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+    summarize: bool = False
+) -> AIResponse:
+    """Extracts (and optionally summarizes) a PDF given as bytes or a spooled file path. Shared by /extract/pdf and /jobs."""
+    try:
+        # Проверка очереди пула - один раз на документ, а не на каждую страницу
+        async with cpu_request():
+            if first_page is not None and last_page is not None and first_page > last_page:
+                logger.warning(f"Invalid page range: first_page ({first_page}) > last_page ({last_page})")
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Invalid page range: first_page ({first_page}) cannot be greater than last_page ({last_page})"
+                )
+
+            # Страницы с текстовым слоем читаем напрямую, растеризуем только сканы
+            pages = await run_cpu_bound(extract_pdf_text_layer, source, first_page=first_page, last_page=last_page)
+            page_sources = [
+                {"page": number, "source": "text_layer" if text is not None else "vision"}
+                for number, text in pages.items()
+            ]
+            runs = _image_page_runs(pages)
+            logger.info(f"Processing PDF: {len(pages)} pages, {sum(r[1] - r[0] + 1 for r in runs)} need rasterization")
+
+            if (not page_cache.enabled and not ocr_enabled() and len(runs) == 1 and runs[0] == (min(pages), max(pages))
+                    and len(pages) <= PDF_PAGES_PER_REQUEST):
+                # Короткий документ из одних сканов без кэша страниц и OCR: один запрос к vision-модели, как раньше
+                system_prompt = get_extract_png_summary_sys_prompt(language) if summarize else get_extract_text_png_sys_prompt(language)
+                images, _, _ = await _render_pages(source, runs[0][0], runs[0][1])
+                result = await openrouter_prompt(
+                    system_prompt=system_prompt,
+                    contents=get_png_payload(prompt="Please extract text from these pictures.", images_base64=images),
+                )
+                return AIResponse(
+                    response=result.response,
+                    raw_response={**result.raw_response, "pages": page_sources}
+                )
+
+            # Остальное: сканы уходят пачками через кэш страниц и OCR, текст склеивается в порядке страниц
+            vision_pages, vision_responses = await _extract_batches(source, runs, language)
+            for entry in page_sources:
+                if entry["page"] in vision_pages:
+                    entry["source"] = vision_pages[entry["page"]][1]
+
+            parts = []
+            for number, text in pages.items():
+                if text is not None:
+                    parts.append(page_text_to_xml(text))
+                elif vision_pages.get(number, (None, ""))[0] is not None:
+                    parts.append(vision_pages[number][0])
+            extracted = "<extracted_text>\n" + "\n".join(parts) + "\n</extracted_text>\n"
+
+            if summarize:
+                result = await summarize_text(text=extracted, language=language)
+                return AIResponse(
+                    response=result.response,
+                    raw_response={**result.raw_response, "pages": page_sources}
+                )
+
+            return AIResponse(
+                response=extracted,
+                raw_response={
+                    "response": extracted,
+                    "pages": page_sources,
+                    "vision_responses": [result.raw_response for result in vision_responses]
+                }
+            )
+    except Exception as e:
+        # Let HTTPException propagate naturally
+        if isinstance(e, HTTPException):
+            raise
+        handle_extraction_error(e, "pdf")
+
+
 @router.post("/pdf", response_model=AIResponse)
 async def extract_pdf(
     file: UploadFile = File(...),
@@ -18,30 +190,8 @@ async def extract_pdf(
     last_page: Optional[int] = Form(None),
     summarize: Optional[bool] = Form(False)
 ):
-    try:
-        validate_file(file, "pdf")
-        
-        if first_page is not None and last_page is not None and first_page > last_page:
-            logger.warning(f"Invalid page range: first_page ({first_page}) > last_page ({last_page})")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid page range: first_page ({first_page}) cannot be greater than last_page ({last_page})"
-            )
-            
-        # Use ternary operator for system prompt selection
-        system_prompt = get_extract_png_summary_sys_prompt(language) if summarize else get_extract_text_png_sys_prompt(language)
-            
-        pdf_bytes = await file.read()
-        images = convert_pdf_to_images(pdf_bytes=pdf_bytes, first_page=first_page, last_page=last_page)
-        logger.info(f"Processing PDF with {len(images)} extracted images")
-        
-        return await openrouter_prompt(
-            system_prompt=system_prompt,
-            contents=get_png_payload(prompt="Please extract text from these pictures.", images=images),
-        )
-    except Exception as e:
-        # Let HTTPException propagate naturally
-        if isinstance(e, HTTPException):
-            raise
-        handle_extraction_error(e, "pdf")
+    validate_file(file, "pdf")
 
+    # Большой PDF уходит в pdf2image и пул процессов путем к файлу, а не копией в памяти
+    with await spool_upload(file) as upload:
+        return await process_pdf(upload.source, language=language, first_page=first_page, last_page=last_page, summarize=summarize)
@@ -1,6 +1,7 @@
 
 from fastapi import HTTPException, UploadFile, File, Form
 from typing import List, Optional
+import asyncio
 import logging
 # Switch back to absolute imports
 from services.ai_services.ai_utils.utils import AIResponse
@@ -8,6 +9,10 @@ from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
 from services.ai_services.ai_utils.system_prompts import get_extract_png_summary_sys_prompt, get_extract_text_png_sys_prompt
 from services.ai_services.extraction.formats.format_utils.format_utils import convert_uploadfile_to_pil_image, get_png_payload
 from services.ai_services.extraction.formats.format_utils.validators import validate_file, handle_extraction_error
+from services.ai_services.extraction.formats.format_utils.page_cache import page_cache, extract_page_texts
+from services.ai_services.extraction.formats.format_utils.ocr import ocr_enabled
+from services.ai_services.ai_utils.long_document import summarize_text
+from services.ai_services.extraction.formats.format_utils.cpu_pool import run_cpu_bound, cpu_request
 
 # Import router using absolute path
 from services.ai_services.extraction.extraction_router import router
@@ -15,33 +20,77 @@ from services.ai_services.extraction.extraction_router import router
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-@router.post("/png", response_model=AIResponse)
-async def extract_png(
-    files: List[str] = Form(...),
-    language: str = Form("auto"),
-    summarize: Optional[bool] = Form(False)
-):    
+async def process_png(files: List[str], language: str = "auto", summarize: bool = False) -> AIResponse:
+    """Extracts text from base64 images. Shared by /extract/png and /jobs."""
     try:
-        # Валидация всех файлов
-        
-        system_prompt = get_extract_text_png_sys_prompt(language)
-        if summarize:
-            system_prompt = get_extract_png_summary_sys_prompt(language)
+        # Проверка очереди пула - один раз на документ, а не на каждую страницу
+        async with cpu_request():
+            if page_cache.enabled or ocr_enabled():
+                return await _process_png_pages(files, language, summarize)
+
+            system_prompt = get_extract_text_png_sys_prompt(language)
+            if summarize:
+                system_prompt = get_extract_png_summary_sys_prompt(language)
         
-        # Конвертируем все изображения в PIL.Image
-        # Используем функцию для множественных изображений
-        return await openrouter_prompt(
-            system_prompt=system_prompt,
-            contents=get_png_payload(
-                prompt="Please extract text from these images.", 
-                images_base64=files
-            ),
-        )
+            # PIL грузится при первом изображении, а не при подключении маршрута
+            from services.ai_services.extraction.formats.format_utils.image_optimizer import optimize_base64_image, PROFILES
+
+            # Пережимаем изображения в общем пуле, не блокируя event loop
+            images = await asyncio.gather(
+                *(run_cpu_bound(optimize_base64_image, image, PROFILES["png"]) for image in files)
+            )
+            return await openrouter_prompt(
+                system_prompt=system_prompt,
+                contents=get_png_payload(
+                    prompt="Please extract text from these images.", 
+                    images_base64=list(images)
+                ),
+            )
     except HTTPException:
         # Пробрасываем HTTPException дальше
         raise
     except Exception as e:
         handle_extraction_error(e, "png")
 
-    
 
+async def _process_png_pages(files: List[str], language: str, summarize: bool) -> AIResponse:
+    # Каждое изображение - отдельная страница: текст берется из кэша страниц или OCR,
+    # в vision-модель уходят только остальные
+    from services.ai_services.extraction.formats.format_utils.image_optimizer import optimize_base64_image_with_hash, PROFILES
+
+    prepared = await asyncio.gather(
+        *(run_cpu_bound(optimize_base64_image_with_hash, image, PROFILES["png"]) for image in files)
+    )
+    images = [image for image, _ in prepared]
+    page_hashes = [page_hash for _, page_hash in prepared]
+    texts, sources, responses = await extract_page_texts(
+        images, page_hashes, language, prompt="Please extract text from these images.",
+        # OCR работает по исходным изображениям, а не по пережатым для модели
+        ocr_images=files
+    )
+    extracted = "<extracted_text>\n" + "\n".join(text for text in texts if text is not None) + "\n</extracted_text>\n"
+    page_sources = [{"page": number, "source": source} for number, source in enumerate(sources, 1)]
+
+    if summarize:
+        result = await summarize_text(text=extracted, language=language)
+        return AIResponse(
+            response=result.response,
+            raw_response={**result.raw_response, "pages": page_sources}
+        )
+    return AIResponse(
+        response=extracted,
+        raw_response={
+            "response": extracted,
+            "pages": page_sources,
+            "vision_responses": [result.raw_response for result in responses]
+        }
+    )
+
+
+@router.post("/png", response_model=AIResponse)
+async def extract_png(
+    files: List[str] = Form(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):    
+    return await process_png(files, language=language, summarize=summarize)
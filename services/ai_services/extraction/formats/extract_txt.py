@@ -5,9 +5,11 @@ import io
 
 # Импорты с абсолютными путями
 from services.ai_services.ai_utils.utils import AIResponse
-from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
-from services.ai_services.ai_utils.system_prompts import get_extract_text_sys_prompt, get_extract_summary_sys_prompt
+from services.ai_services.ai_utils.long_document import summarize_text
 from services.ai_services.extraction.formats.format_utils.validators import validate_file, handle_extraction_error
+from services.ai_services.extraction.formats.format_utils.uploads import spool_upload
+from services.ai_services.extraction.formats.format_utils.format_utils import decode_text_bytes, DocumentSource
+from services.ai_services.extraction.formats.format_utils.cpu_pool import run_cpu_bound
 
 # Импорт роутера с абсолютным путем
 from services.ai_services.extraction.extraction_router import router
@@ -15,41 +17,13 @@ from services.ai_services.extraction.extraction_router import router
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-@router.post("/txt", response_model=AIResponse)
-async def extract_txt(
-    files: List[UploadFile] = File(...),
-    language: str = Form("auto"),
-    summarize: Optional[bool] = Form(False)
-):    
+async def process_txt(contents: List[DocumentSource], language: str = "auto", summarize: bool = False) -> AIResponse:
+    """Decodes (and optionally summarizes) text files given as bytes or spooled file paths. Shared by /extract/txt and /jobs."""
     try:
-        # Валидация всех файлов
-        for file in files:
-            validate_file(file, "txt")
-        
-        # Выбор системного промпта в зависимости от параметра summarize
-
-        if(summarize):
-            system_prompt = get_summary_sys_prompt(language)
-        
-        # Чтение содержимого всех текстовых файлов
         text_contents = []
-        for file in files:
-            content = await file.read()
-            try:
-                # Пытаемся декодировать как UTF-8
-                text_content = content.decode('utf-8')
-            except UnicodeDecodeError:
-                # Если не получается, пробуем другие кодировки
-                try:
-                    text_content = content.decode('cp1251')  # Windows-1251 для кириллицы
-                except UnicodeDecodeError:
-                    # Если и это не работает, используем latin-1 (который всегда работает)
-                    text_content = content.decode('latin-1')
-            
-            text_contents.append(text_content)
-            
-            # Сбрасываем указатель файла для возможного повторного использования
-            await file.seek(0)
+        for content in contents:
+            # Перебор кодировок на больших файлах - тяжелая работа, выносим из event loop
+            text_contents.append(await run_cpu_bound(decode_text_bytes, content))
         
         logger.info(f"Обработка {len(text_contents)} текстовых файлов")
         
@@ -58,14 +32,35 @@ async def extract_txt(
         
         # Отправляем запрос на обработку
         if(summarize):
-            return await openrouter_prompt(
-            system_prompt=system_prompt,
-            contents=[{"type": "text", "text": combined_text}],
-            )
-        return combined_text
+            return await summarize_text(text=combined_text, language=language)
+        return AIResponse(
+            response=combined_text,
+            raw_response={'response': combined_text}
+        )
 
     except HTTPException:
         # Пробрасываем HTTPException дальше
         raise
     except Exception as e:
-        handle_extraction_error(e, "txt")
\ No newline at end of file
+        handle_extraction_error(e, "txt")
+
+
+@router.post("/txt", response_model=AIResponse)
+async def extract_txt(
+    files: List[UploadFile] = File(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):    
+    # Валидация всех файлов
+    for file in files:
+        validate_file(file, "txt")
+    
+    # Чтение содержимого всех текстовых файлов
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await spool_upload(file))
+        return await process_txt([upload.source for upload in uploads], language=language, summarize=summarize)
+    finally:
+        for upload in uploads:
+            upload.close()
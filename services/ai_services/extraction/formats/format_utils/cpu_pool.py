@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import multiprocessing
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, TypeVar
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# "process" - для работы, держащей GIL (python-docx, PyPDF2, декодирование);
+# "thread" - если тяжелая часть отпускает GIL (pdftocairo в подпроцессе, Pillow)
+CPU_POOL_KIND = os.getenv("CPU_POOL_KIND", "process")
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", os.cpu_count() or 2))
+# Сколько задач может ждать и выполняться одновременно, сверх - 503. Проверяется один раз
+# при входе запроса (cpu_request): свои подзадачи запроса (страницы, изображения) не отклоняются
+CPU_POOL_MAX_QUEUE = int(os.getenv("CPU_POOL_MAX_QUEUE", max(CPU_POOL_WORKERS * 4, 16)))
+# Сколько задач одного запроса выполняется одновременно; остальные ждут внутри запроса
+CPU_POOL_REQUEST_CONCURRENCY = int(os.getenv("CPU_POOL_REQUEST_CONCURRENCY", CPU_POOL_WORKERS))
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+
+_executor: Optional[Executor] = None
+_in_flight = 0
+# Семафор запроса, уже прошедшего проверку очереди; наследуется задачами asyncio.gather
+_request_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("cpu_request_slots", default=None)
+
+pool_stats: Dict[str, Any] = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "in_flight": 0,
+    "queue_wait_seconds_total": 0.0,
+    "run_seconds_total": 0.0,
+}
+
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if CPU_POOL_KIND == "thread":
+            _executor = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="cpu-pool")
+        else:
+            _executor = ProcessPoolExecutor(
+                max_workers=CPU_POOL_WORKERS,
+                mp_context=multiprocessing.get_context(CPU_POOL_START_METHOD)
+            )
+        logger.info(f"Started {CPU_POOL_KIND} pool with {CPU_POOL_WORKERS} workers")
+    return _executor
+
+
+def _timed_call(fn: Callable[..., T], args: Tuple, kwargs: Dict[str, Any]) -> Tuple[T, float, float]:
+    # Выполняется в воркере: возвращаем время старта, чтобы отделить ожидание в очереди от работы
+    started_at = time.time()
+    result = fn(*args, **kwargs)
+    return result, started_at, time.time()
+
+
+def _admit() -> None:
+    if _in_flight >= CPU_POOL_MAX_QUEUE:
+        pool_stats["rejected"] += 1
+        logger.warning(f"CPU pool queue is full ({_in_flight} tasks), rejecting request")
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy processing other documents, please retry later"
+        )
+
+
+@asynccontextmanager
+async def cpu_request(concurrency: int = CPU_POOL_REQUEST_CONCURRENCY) -> AsyncIterator[None]:
+    """
+    Допускает запрос к пулу один раз: если очередь не переполнена, все run_cpu_bound
+    внутри блока (в том числе в задачах gather) выполняются без проверки, не больше
+    concurrency одновременно. Вложенные блоки ничего не делают.
+
+    Raises:
+        HTTPException: 503, если очередь пула переполнена
+    """
+    if _request_slots.get() is not None:
+        yield
+        return
+    _admit()
+    token = _request_slots.set(asyncio.Semaphore(concurrency))
+    try:
+        yield
+    finally:
+        _request_slots.reset(token)
+
+
+async def run_cpu_bound(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Выполняет CPU-тяжелую функцию в общем пуле, не блокируя event loop.
+
+    Args:
+        fn: Функция уровня модуля (должна сериализоваться pickle для пула процессов)
+        *args: Позиционные аргументы fn
+        **kwargs: Именованные аргументы fn
+
+    Returns:
+        Результат fn
+
+    Raises:
+        HTTPException: 503, если очередь пула переполнена (только вне cpu_request)
+    """
+    slots = _request_slots.get()
+    if slots is None:
+        _admit()
+        return await _submit(fn, args, kwargs)
+    async with slots:
+        return await _submit(fn, args, kwargs)
+
+
+async def _submit(fn: Callable[..., T], args: Tuple, kwargs: Dict[str, Any]) -> T:
+    global _in_flight
+    _in_flight += 1
+    pool_stats["submitted"] += 1
+    pool_stats["in_flight"] = _in_flight
+    submitted_at = time.time()
+    try:
+        loop = asyncio.get_running_loop()
+        result, started_at, finished_at = await loop.run_in_executor(
+            _get_executor(), functools.partial(_timed_call, fn, args, kwargs)
+        )
+        pool_stats["completed"] += 1
+        pool_stats["queue_wait_seconds_total"] += max(started_at - submitted_at, 0.0)
+        pool_stats["run_seconds_total"] += finished_at - started_at
+        return result
+    except Exception:
+        pool_stats["failed"] += 1
+        raise
+    finally:
+        _in_flight -= 1
+        pool_stats["in_flight"] = _in_flight
+
+
+def shutdown_cpu_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
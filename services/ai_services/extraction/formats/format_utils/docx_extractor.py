@@ -0,0 +1,182 @@
+import io
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Tuple, Union
+
+# Потоковое извлечение текста из DOCX: word/document.xml читается из zip через iterparse,
+# обработанные блоки сразу удаляются из дерева, поэтому память не растет с длиной документа.
+# Текст параграфов и ячеек совпадает с python-docx (Paragraph.text, _Row.cells).
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_BODY = _W + "body"
+_P = _W + "p"
+_R = _W + "r"
+_HYPERLINK = _W + "hyperlink"
+_TBL = _W + "tbl"
+_TR = _W + "tr"
+_TC = _W + "tc"
+_VAL = _W + "val"
+
+_RELATIONSHIPS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+
+Block = Tuple[str, Union[str, List[List[str]]]]
+
+
+def _run_text(run: ET.Element) -> str:
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == _W + "t":
+            parts.append(child.text or "")
+        elif tag in (_W + "tab", _W + "ptab"):
+            parts.append("\t")
+        elif tag == _W + "br":
+            # Разрывы страницы и колонки текста не дают
+            if child.get(_W + "type", "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == _W + "cr":
+            parts.append("\n")
+        elif tag == _W + "noBreakHyphen":
+            parts.append("-")
+    return "".join(parts)
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    parts = []
+    for child in paragraph:
+        if child.tag == _R:
+            parts.append(_run_text(child))
+        elif child.tag == _HYPERLINK:
+            parts.extend(_run_text(run) for run in child if run.tag == _R)
+    return "".join(parts)
+
+
+def _cell_text(cell: ET.Element) -> str:
+    texts = (_paragraph_text(p).strip() for p in cell if p.tag == _P)
+    return " ".join(text for text in texts if text)
+
+
+def _int_val(parent: ET.Element, path: str, default: int) -> int:
+    element = parent.find(path)
+    try:
+        return int(element.get(_VAL)) if element is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _table_rows(table: ET.Element) -> List[List[str]]:
+    """Cell texts per row; a cell spanning several grid columns repeats, a vertical merge repeats the cell above."""
+    rows = []
+    above: Dict[int, str] = {}
+    for row in table:
+        if row.tag != _TR:
+            continue
+        offset = _int_val(row, f"{_W}trPr/{_W}gridBefore", 0)
+        cells: List[str] = []
+        current: Dict[int, str] = {}
+        for cell in row:
+            if cell.tag != _TC:
+                continue
+            span = max(_int_val(cell, f"{_W}tcPr/{_W}gridSpan", 1), 1)
+            v_merge = cell.find(f"{_W}tcPr/{_W}vMerge")
+            if v_merge is not None and v_merge.get(_VAL, "continue") == "continue" and offset in above:
+                text = above[offset]
+            else:
+                text = _cell_text(cell)
+            current[offset] = text
+            cells.extend([text] * span)
+            offset += span
+        above = current
+        rows.append(cells)
+    return rows
+
+
+def _main_document_part(archive: zipfile.ZipFile) -> str:
+    """Path of the main document part from _rels/.rels (almost always word/document.xml)."""
+    try:
+        rels = ET.fromstring(archive.read("_rels/.rels"))
+    except (KeyError, ET.ParseError):
+        return "word/document.xml"
+    for rel in rels.iter(_RELATIONSHIPS_NS + "Relationship"):
+        if rel.get("Type") == _OFFICE_DOCUMENT:
+            return posixpath.normpath(rel.get("Target", "").lstrip("/"))
+    return "word/document.xml"
+
+
+def iter_docx_blocks(source: Union[bytes, str]) -> Iterator[Block]:
+    """
+    Отдает блоки тела документа в порядке следования.
+
+    Args:
+        source: Содержимое DOCX или путь к файлу
+
+    Yields:
+        ("text", текст параграфа) для непустых параграфов и ("table", строки с текстом ячеек)
+    """
+    with zipfile.ZipFile(source if isinstance(source, str) else io.BytesIO(source)) as archive:
+        with archive.open(_main_document_part(archive)) as stream:
+            stack: List[ET.Element] = []
+            body = None
+            for event, element in ET.iterparse(stream, events=("start", "end")):
+                if event == "start":
+                    if element.tag == _BODY and body is None:
+                        body = element
+                    stack.append(element)
+                    continue
+
+                stack.pop()
+                if body is None or not stack or stack[-1] is not body:
+                    continue
+
+                if element.tag == _P:
+                    text = _paragraph_text(element).strip()
+                    if text:
+                        yield "text", text
+                elif element.tag == _TBL:
+                    yield "table", _table_rows(element)
+                # Блок обработан - освобождаем его поддерево
+                element.clear()
+                body.remove(element)
+
+
+def _escape(text: str) -> str:
+    # То же экранирование, что у minidom.toprettyxml
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _leaf(tag: str, text: str, indent: str) -> str:
+    if not text:
+        return f"{indent}<{tag}/>\n"
+    return f"{indent}<{tag}>{_escape(text)}</{tag}>\n"
+
+
+def format_block(kind: str, value: Union[str, List[List[str]]]) -> str:
+    """Formats one block with the same 2-space layout the minidom-based extractor produced."""
+    if kind == "text":
+        return _leaf("text", value, "  ")
+    if not value:
+        return "  <table/>\n"
+    parts = ["  <table>\n"]
+    for row in value:
+        if not row:
+            parts.append("    <row/>\n")
+            continue
+        parts.append("    <row>\n")
+        # "coloumn" - исторически сложившееся имя элемента, на него рассчитывают клиенты
+        parts.extend(_leaf("coloumn", cell, "      ") for cell in row)
+        parts.append("    </row>\n")
+    parts.append("  </table>\n")
+    return "".join(parts)
+
+
+def iter_docx_xml(source: Union[bytes, str]) -> Iterator[str]:
+    """Yields the <extracted_text> document piece by piece as blocks are parsed."""
+    started = False
+    for kind, value in iter_docx_blocks(source):
+        if not started:
+            yield "<extracted_text>\n"
+            started = True
+        yield format_block(kind, value)
+    yield "</extracted_text>\n" if started else "<extracted_text/>\n"
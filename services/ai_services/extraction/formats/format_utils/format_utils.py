@@ -1,14 +1,24 @@
-from fastapi import UploadFile
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
 import io
-from PIL import Image
-from pdf2image import convert_from_bytes
-from docx import Document
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import os
+import re
+import mmap
+import time
+import tempfile
+from xml.sax.saxutils import escape
 import base64
 
-async def convert_uploadfile_to_pil_image(upload_file: UploadFile) -> Image.Image:
+# pdf2image, PyPDF2, PIL (с image_optimizer) и разбор DOCX импортируются при первом использовании:
+# модуль загружается и в воркерах пула, и при старте сервера (extract_txt), а нужны они только
+# для своих форматов
+if TYPE_CHECKING:
+    from fastapi import UploadFile
+    from PIL import Image
+    from services.ai_services.extraction.formats.format_utils.image_optimizer import ImageProfile
+
+async def convert_uploadfile_to_pil_image(upload_file: "UploadFile") -> "Image.Image":
+    from PIL import Image
+
     # Чтение байтов из файла
     contents = await upload_file.read()
     # Создание объекта BytesIO из байтов
@@ -20,98 +30,251 @@ async def convert_uploadfile_to_pil_image(upload_file: UploadFile) -> Image.Imag
     return pil_image
 
 
-def convert_pdf_to_images(
-    pdf_bytes: bytes,
+# Содержимое документа в памяти или путь к временному файлу, в который сброшена большая загрузка
+DocumentSource = Union[bytes, str]
+
+
+def _as_file(source: DocumentSource):
+    """Path or in-memory stream for libraries that accept either (PyPDF2, python-docx)."""
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+# Сколько страниц растеризуется за один вызов pdftocairo
+PDF_RENDER_WINDOW = int(os.getenv("PDF_RENDER_WINDOW", 4))
+# Сколько страниц уходит в один запрос к vision-модели
+PDF_PAGES_PER_REQUEST = int(os.getenv("PDF_PAGES_PER_REQUEST", 10))
+
+
+def get_pdf_page_count(source: DocumentSource) -> int:
+    from pdf2image import pdfinfo_from_bytes, pdfinfo_from_path
+
+    try:
+        info = pdfinfo_from_path(source) if isinstance(source, str) else pdfinfo_from_bytes(source)
+        return int(info["Pages"])
+    except Exception as e:
+        raise ValueError(f"Ошибка чтения PDF: {str(e)}")
+
+
+def iter_pdf_images(
+    source: DocumentSource,
     dpi: int = 200,
     first_page: Optional[int] = None,
     last_page: Optional[int] = None,
-    fmt: str = 'jpeg',
-    thread_count: int = 4
-) -> List[Image.Image]:
+    fmt: str = 'ppm',
+    window: int = PDF_RENDER_WINDOW,
+    profile: Optional["ImageProfile"] = None,
+    timings: Optional[Dict[str, float]] = None,
+    page_hashes: Optional[List[str]] = None,
+    ocr_images: Optional[List[str]] = None
+) -> Iterator[str]:
+    """
+    Растеризует PDF окнами по window страниц и отдает base64 по одной странице.
+
+    В памяти одновременно находится не больше одного окна декодированных страниц,
+    поэтому пиковое потребление не зависит от количества страниц.
+
+    Args:
+        source: Содержимое PDF или путь к файлу
+        dpi: Разрешение растеризации
+        first_page: Первая страница (с 1)
+        last_page: Последняя страница (включительно)
+        fmt: Промежуточный формат pdftocairo (без потерь, страница все равно пережимается)
+        window: Количество страниц, растеризуемых за один вызов
+        profile: Профиль оптимизации изображений (по умолчанию PROFILES["pdf"])
+        timings: Если передан, в него суммируется время стадий pdf_rasterization и image_encoding
+        page_hashes: Если передан, в него добавляется page_image_hash каждой страницы
+        ocr_images: Если передан, в него добавляется копия каждой страницы без потерь (PNG) для OCR
+
+    Yields:
+        Изображение страницы как data URL
+    """
+    if not isinstance(source, str):
+        # convert_from_bytes пишет временную копию PDF на каждое окно - делаем одну на весь документ
+        with tempfile.NamedTemporaryFile(prefix="pdf-", suffix=".pdf") as tmp:
+            tmp.write(source)
+            tmp.flush()
+            yield from iter_pdf_images(
+                tmp.name, dpi, first_page, last_page, fmt, window, profile, timings, page_hashes, ocr_images
+            )
+        return
+
+    from pdf2image import convert_from_path
+    from services.ai_services.extraction.formats.format_utils.image_optimizer import (
+        PROFILES, optimize_to_data_url, page_image_hash, lossless_data_url
+    )
+
+    profile = profile or PROFILES["pdf"]
+    start = first_page or 1
+    end = last_page or get_pdf_page_count(source)
+
+    for window_start in range(start, end + 1, window):
+        window_end = min(window_start + window - 1, end)
+        started = time.perf_counter()
+        try:
+            images = convert_from_path(
+                source,
+                dpi=dpi,
+                first_page=window_start,
+                last_page=window_end,
+                fmt=fmt,
+                thread_count=1,
+                use_pdftocairo=True,
+                transparent=False
+            )
+        except Exception as e:
+            raise ValueError(f"Ошибка конвертации PDF: {str(e)}")
+
+        if timings is not None:
+            timings["pdf_rasterization"] = timings.get("pdf_rasterization", 0.0) + time.perf_counter() - started
+
+        while images:
+            image = images.pop(0)
+            if page_hashes is not None:
+                page_hashes.append(page_image_hash(image))
+            started = time.perf_counter()
+            encoded = optimize_to_data_url(image, profile)
+            if ocr_images is not None:
+                ocr_images.append(lossless_data_url(image))
+            if timings is not None:
+                # Включает уменьшение, пережатие и base64
+                timings["image_encoding"] = timings.get("image_encoding", 0.0) + time.perf_counter() - started
+            image.close()
+            yield encoded
+
+
+def render_pdf_pages(
+    source: DocumentSource,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+    for_ocr: bool = False
+) -> Tuple[List[str], List[str], Optional[List[str]], Dict[str, float]]:
+    """
+    iter_pdf_images for the worker pool: returns the optimized pages, page hashes for the
+    page cache, lossless copies for OCR (only with for_ocr) and per-stage timings measured
+    inside the worker process.
+    """
+    timings: Dict[str, float] = {}
+    page_hashes: List[str] = []
+    ocr_images: Optional[List[str]] = [] if for_ocr else None
+    images = list(iter_pdf_images(
+        source, first_page=first_page, last_page=last_page,
+        timings=timings, page_hashes=page_hashes, ocr_images=ocr_images
+    ))
+    return images, page_hashes, ocr_images, timings
+
+# Минимум символов на странице, чтобы считать текстовый слой пригодным
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", 50))
+
+
+def extract_pdf_text_layer(
+    source: DocumentSource,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+    min_chars: int = PDF_TEXT_LAYER_MIN_CHARS
+) -> Dict[int, Optional[str]]:
+    """
+    Извлекает встроенный текстовый слой PDF постранично.
+
+    Args:
+        source: Содержимое PDF или путь к файлу
+        first_page: Первая страница (с 1)
+        last_page: Последняя страница (включительно)
+        min_chars: Минимальная длина текста, чтобы страница не считалась сканом
+
+    Returns:
+        Словарь {номер страницы: текст}, где None означает, что страницу нужно растеризовать
+    """
+    from PyPDF2 import PdfReader
+
     try:
-        images = convert_from_bytes(
-            pdf_bytes,
-            dpi=dpi,
-            first_page=first_page,
-            last_page=last_page,
-            fmt=fmt,
-            thread_count=thread_count,
-            use_pdftocairo=True,
-            transparent=False
-        )
-        
-        # Конвертируем в RGB, если нужно (для JPEG)
-        if fmt.lower() == 'jpeg':
-            images = [image.convert('RGB') for image in images]
-        
-        base64_images = []
-        for image in pil_images:
-            buffer = io.BytesIO()
-            image.save(buffer, format=fmt.upper())
-            img_str = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            base64_images.append(img_str)
-            
-        return base64_images
-
-        
+        reader = PdfReader(_as_file(source))
+        total = len(reader.pages)
     except Exception as e:
-        raise ValueError(f"Ошибка конвертации PDF: {str(e)}")
+        raise ValueError(f"Ошибка чтения PDF: {str(e)}")
 
-def get_text_from_docx(doc_bytes: bytes) -> str:
-    root = ET.Element("extracted_text")
-    
-    # Открываем документ из байтов
-    doc_stream = io.BytesIO(doc_bytes)
+    start = max(first_page or 1, 1)
+    end = min(last_page or total, total)
+
+    pages = {}
+    for number in range(start, end + 1):
+        try:
+            text = reader.pages[number - 1].extract_text() or ""
+        except Exception:
+            # Поврежденный или нестандартный контент - отдаем странице путь через картинку
+            text = ""
+        pages[number] = text if len(text.strip()) >= min_chars else None
+    return pages
+
+
+def page_text_to_xml(text: str) -> str:
+    """Formats text-layer text as <text> elements, one per paragraph, like the vision extraction output."""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    if not paragraphs:
+        paragraphs = [text.strip()]
+    return "\n".join(f"  <text>{escape(' '.join(p.split()))}</text>" for p in paragraphs)
+
+
+def strip_extracted_text_root(xml: str) -> str:
+    """Returns the inner part of an <extracted_text> document returned by the model."""
+    match = re.search(r"<extracted_text>(.*?)</extracted_text>", xml, re.DOTALL)
+    return (match.group(1) if match else xml).strip("\n")
+
+
+def decode_text_bytes(source: DocumentSource) -> str:
+    if isinstance(source, str):
+        # Файл на диске декодируется прямо из отображения в память, без промежуточной копии bytes
+        if os.path.getsize(source) == 0:
+            return ""
+        with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _decode(mapped)
+    return _decode(source)
+
+
+def _decode(content) -> str:
     try:
-        doc = Document(doc_stream)
-        
-        # Обрабатываем параграфы
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():  # Проверяем, что параграф не пустой
-                text_elem = ET.SubElement(root, "text")
-                text_elem.text = paragraph.text.strip()
-                # Fixed: Changed print.paragraph to print(paragraph.text)
-        
-        # Обрабатываем таблицы
-        for table in doc.tables:
-            table_elem = ET.SubElement(root, "table")
-            
-            for row in table.rows:
-                row_elem = ET.SubElement(table_elem, "row")
-                
-                for cell in row.cells:
-                    # Используем "coloumn" как в примере (хотя правильно было бы "column")
-                    col_elem = ET.SubElement(row_elem, "coloumn")
-                    # Извлекаем текст из ячейки
-                    cell_text = ""
-                    for paragraph in cell.paragraphs:
-                        if paragraph.text.strip():
-                            cell_text += paragraph.text.strip() + " "
-                    col_elem.text = cell_text.strip()
-        
-        # Преобразуем XML в строку с красивым форматированием
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="  ").replace('<?xml version="1.0" ?>\n', '')
-        
-    except Exception as e:
-        # Если произошла ошибка, возвращаем XML с сообщением об ошибке
-        error_elem = ET.SubElement(root, "text")
-        error_elem.text = f"Ошибка при извлечении текста: {str(e)}"
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="  ").replace('<?xml version="1.0" ?>\n', '')
+        # Пытаемся декодировать как UTF-8
+        return str(content, 'utf-8')
+    except UnicodeDecodeError:
+        # Если не получается, пробуем другие кодировки
+        try:
+            return str(content, 'cp1251')  # Windows-1251 для кириллицы
+        except UnicodeDecodeError:
+            # Если и это не работает, используем latin-1 (который всегда работает)
+            return str(content, 'latin-1')
 
 
+def get_text_from_docx(source: DocumentSource) -> str:
+    """
+    Извлекает параграфы и таблицы DOCX в порядке следования в документе.
+
+    Args:
+        source: Содержимое DOCX или путь к файлу
+
+    Returns:
+        XML <extracted_text> с элементами <text> и <table>
+    """
+    from services.ai_services.extraction.formats.format_utils.docx_extractor import iter_docx_xml, format_block
+
+    parts = []
+    try:
+        parts.extend(iter_docx_xml(source))
+        return "".join(parts)
+    except Exception as e:
+        # Если произошла ошибка, возвращаем XML с сообщением об ошибке (и то, что успели извлечь)
+        blocks = parts[1:] if parts else []
+        return "<extracted_text>\n" + "".join(blocks) + format_block("text", f"Ошибка при извлечении текста: {str(e)}") + "</extracted_text>\n"
+
 
-def get_png_payload(prompt: str, images_base64: str) -> list:
+def get_png_payload(prompt: str, images_base64: List[str]) -> list:
 
     contents = [{ "type": "input_text", "text": prompt},]
 
     for image_base64 in images_base64:
+        # Оптимизированные изображения уже приходят как data URL со своим MIME-типом
+        image_url = image_base64 if image_base64.startswith("data:") else f"data:image/jpeg;base64,{image_base64}"
         contents.append({
         "type": "input_image",
-        "image_url": f"data:image/jpeg;base64,{image_base64}",
+        "image_url": image_url,
         },)
     return contents
 
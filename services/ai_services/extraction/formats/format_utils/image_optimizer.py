@@ -0,0 +1,172 @@
+import io
+import os
+import base64
+import hashlib
+import logging
+from typing import Dict, Tuple
+from pydantic import BaseModel
+from PIL import Image, ImageStat, features
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WEBP_SUPPORTED = features.check("webp")
+# Ширина нормализованной копии страницы, по которой считается ее хеш
+PAGE_HASH_WIDTH = int(os.getenv("PAGE_HASH_WIDTH", 256))
+
+
+class ImageProfile(BaseModel):
+    """Parameters of the image optimization stage for one input format."""
+    max_long_edge: int = 1600
+    format: str = "webp"
+    quality_max: int = 85
+    # Ниже этого качества текст на сканах перестает надежно распознаваться
+    quality_min: int = 45
+    byte_budget: int = 250_000
+    grayscale_text_pages: bool = True
+    # Средняя насыщенность (0-255), ниже которой страница считается черно-белой
+    saturation_threshold: float = 12.0
+
+
+def _profile_from_env(name: str, defaults: ImageProfile) -> ImageProfile:
+    prefix = f"IMAGE_PROFILE_{name.upper()}_"
+    return ImageProfile(
+        max_long_edge=int(os.getenv(prefix + "MAX_LONG_EDGE", defaults.max_long_edge)),
+        format=os.getenv(prefix + "FORMAT", defaults.format).lower(),
+        quality_max=int(os.getenv(prefix + "QUALITY_MAX", defaults.quality_max)),
+        quality_min=int(os.getenv(prefix + "QUALITY_MIN", defaults.quality_min)),
+        byte_budget=int(os.getenv(prefix + "BYTE_BUDGET", defaults.byte_budget)),
+        grayscale_text_pages=os.getenv(prefix + "GRAYSCALE", str(defaults.grayscale_text_pages)).lower() == "true",
+        saturation_threshold=float(os.getenv(prefix + "SATURATION_THRESHOLD", defaults.saturation_threshold)),
+    )
+
+
+# Профили по источнику изображения, переопределяются переменными IMAGE_PROFILE_<NAME>_*
+PROFILES: Dict[str, ImageProfile] = {
+    # Растеризованные страницы PDF: в основном текст
+    "pdf": _profile_from_env("pdf", ImageProfile(max_long_edge=1600, byte_budget=250_000)),
+    # Загруженные пользователем картинки: фото доски, скриншоты
+    "png": _profile_from_env("png", ImageProfile(max_long_edge=2000, byte_budget=400_000, quality_max=90)),
+}
+
+
+def is_text_only(image: Image.Image, saturation_threshold: float) -> bool:
+    """Cheap check on a thumbnail: pages without noticeable color can be sent as grayscale."""
+    thumbnail = image.convert("RGB")
+    thumbnail.thumbnail((64, 64))
+    saturation = thumbnail.convert("HSV").getchannel("S")
+    return ImageStat.Stat(saturation).mean[0] < saturation_threshold
+
+
+def page_image_hash(image: Image.Image, width: int = PAGE_HASH_WIDTH) -> str:
+    """
+    Хеш нормализованной страницы: оттенки серого, фиксированная ширина, 16 уровней яркости.
+
+    Одна и та же страница, растеризованная из разных PDF или пережатая по-разному,
+    дает тот же хеш, поэтому ее текст можно взять из кэша страниц.
+    """
+    gray = image.convert("L")
+    height = max(round(gray.height * width / gray.width), 1)
+    normalized = gray.resize((width, height), Image.BILINEAR).point(lambda value: value >> 4)
+    digest = hashlib.sha256(f"{width}x{height}:".encode())
+    digest.update(normalized.tobytes())
+    return digest.hexdigest()
+
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def optimize_image(image: Image.Image, profile: ImageProfile) -> Tuple[bytes, str]:
+    """
+    Уменьшает и пережимает изображение перед отправкой в vision-модель.
+
+    Args:
+        image: Исходное изображение
+        profile: Профиль оптимизации
+
+    Returns:
+        Закодированные байты и MIME-тип
+    """
+    fmt = profile.format if profile.format != "webp" or WEBP_SUPPORTED else "jpeg"
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if max(image.size) > profile.max_long_edge:
+        image = image.copy()
+        image.thumbnail((profile.max_long_edge, profile.max_long_edge), Image.LANCZOS)
+    if profile.grayscale_text_pages and image.mode != "L" and is_text_only(image, profile.saturation_threshold):
+        image = image.convert("L")
+
+    # Бинарный поиск максимального качества, укладывающегося в бюджет
+    data = _encode(image, fmt, profile.quality_max)
+    if len(data) > profile.byte_budget:
+        low, high = profile.quality_min, profile.quality_max - 1
+        best = None
+        while low <= high:
+            quality = (low + high) // 2
+            candidate = _encode(image, fmt, quality)
+            if len(candidate) <= profile.byte_budget:
+                best = candidate
+                low = quality + 1
+            else:
+                high = quality - 1
+        # Если даже минимальное качество не укладывается - не жертвуем читаемостью
+        data = best if best is not None else _encode(image, fmt, profile.quality_min)
+
+    return data, f"image/{fmt}"
+
+
+def optimize_to_data_url(image: Image.Image, profile: ImageProfile) -> str:
+    data, mime_type = optimize_image(image, profile)
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def lossless_data_url(image: Image.Image) -> str:
+    """Full-resolution PNG of a rendered page for local OCR: lossy downscaling costs tesseract small print."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+
+def decode_base64_image(image_base64: str) -> Tuple[str, bytes, Image.Image]:
+    if image_base64.startswith("data:") and "," in image_base64:
+        image_base64 = image_base64.split(",", 1)[1]
+    try:
+        raw = base64.b64decode(image_base64)
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Не удалось декодировать изображение: {str(e)}")
+    return image_base64, raw, image
+
+
+def _optimize_decoded(image_base64: str, raw: bytes, image: Image.Image, profile: ImageProfile) -> str:
+    # Уже компактное изображение не пережимаем повторно
+    if (image.format in ("JPEG", "WEBP") and len(raw) <= profile.byte_budget
+            and max(image.size) <= profile.max_long_edge):
+        return f"data:image/{image.format.lower()};base64,{image_base64}"
+    return optimize_to_data_url(image, profile)
+
+
+def optimize_base64_image(image_base64: str, profile: ImageProfile) -> str:
+    """
+    Оптимизирует изображение, присланное в base64 или как data URL.
+
+    Returns:
+        Оптимизированное изображение как data URL
+    """
+    return _optimize_decoded(*decode_base64_image(image_base64), profile)
+
+
+def optimize_base64_image_with_hash(image_base64: str, profile: ImageProfile) -> Tuple[str, str]:
+    """optimize_base64_image plus page_image_hash of the same decoded image, for the page cache."""
+    image_base64, raw, image = decode_base64_image(image_base64)
+    return _optimize_decoded(image_base64, raw, image, profile), page_image_hash(image)
@@ -0,0 +1,97 @@
+import os
+import shutil
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+from dotenv import load_dotenv
+from services.ai_services.extraction.formats.format_utils.format_utils import page_text_to_xml
+from services.ai_services.ai_utils.metrics import register_stats
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Локальный OCR перед vision-моделью; без установленного tesseract этап просто пропускается
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+# Языки tesseract (нужны соответствующие traineddata), не путать с языком ответа
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng+rus")
+# Средняя уверенность tesseract (0-100), начиная с которой текст страницы принимается без vision-модели
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", 80))
+# Страницы с меньшим числом слов (фото, схемы, пустые) всегда уходят в vision-модель
+OCR_MIN_WORDS = int(os.getenv("OCR_MIN_WORDS", 5))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", 30))
+
+ocr_stats: Dict[str, Any] = {
+    "pages": 0,
+    "accepted": 0,
+    "escalated": 0,
+    "failed": 0,
+    # Страницы, для которых vision-модель не ответила и остался текст OCR
+    "fallbacks": 0,
+}
+
+
+@lru_cache(maxsize=1)
+def tesseract_available() -> bool:
+    import pytesseract
+
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+
+def ocr_enabled() -> bool:
+    return OCR_ENABLED and tesseract_available()
+
+
+def ocr_page(image_base64: str, languages: str = OCR_LANGUAGES) -> Tuple[str, float, int]:
+    """
+    Распознает страницу tesseract'ом. Выполняется в пуле процессов.
+
+    Args:
+        image_base64: Изображение в base64 или как data URL
+        languages: Языки tesseract, например "eng+rus"
+
+    Returns:
+        Текст страницы в формате <text>-элементов, средняя уверенность по словам
+        (взвешенная по длине слова) и число слов
+    """
+    import pytesseract
+    from services.ai_services.extraction.formats.format_utils.image_optimizer import decode_base64_image
+
+    _, _, image = decode_base64_image(image_base64)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    data = pytesseract.image_to_data(
+        image, lang=languages, output_type=pytesseract.Output.DICT, timeout=OCR_TIMEOUT
+    )
+
+    paragraphs: Dict[Tuple[int, int], Dict[int, List[str]]] = {}
+    weighted, characters, words = 0.0, 0, 0
+    for word, confidence, block, paragraph, line in zip(
+        data["text"], data["conf"], data["block_num"], data["par_num"], data["line_num"]
+    ):
+        word = word.strip()
+        confidence = float(confidence)
+        if not word or confidence < 0:
+            continue
+        paragraphs.setdefault((block, paragraph), {}).setdefault(line, []).append(word)
+        weighted += confidence * len(word)
+        characters += len(word)
+        words += 1
+
+    if not words:
+        return "", 0.0, 0
+    text = "\n\n".join(
+        "\n".join(" ".join(line) for line in lines.values()) for lines in paragraphs.values()
+    )
+    return page_text_to_xml(text), weighted / characters, words
+
+
+def accept_ocr(confidence: float, words: int) -> bool:
+    return words >= OCR_MIN_WORDS and confidence >= OCR_MIN_CONFIDENCE
+
+
+def get_ocr_stats() -> Dict[str, Any]:
+    return {**ocr_stats, "available": int(tesseract_available()), "min_confidence": OCR_MIN_CONFIDENCE}
+
+
+register_stats("ocr", get_ocr_stats)
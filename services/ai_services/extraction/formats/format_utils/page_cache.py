@@ -0,0 +1,175 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.utils import AIResponse
+from services.ai_services.ai_utils.http_client import settings
+from services.ai_services.ai_utils.kv_store import SizeBoundedStore
+from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
+from services.ai_services.ai_utils.metrics import observe_stage, register_stats
+from services.ai_services.ai_utils.system_prompts import get_extract_text_png_sys_prompt
+from services.ai_services.extraction.formats.format_utils.format_utils import get_png_payload, strip_extracted_text_root
+from services.ai_services.extraction.formats.format_utils.cpu_pool import run_cpu_bound, cpu_request
+from services.ai_services.extraction.formats.format_utils.ocr import ocr_page, ocr_enabled, accept_ocr, ocr_stats
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "true").lower() == "true"
+PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH", ".cache/page_cache.sqlite3")
+# Предельный объем текста в кэше; при превышении удаляются давно не использованные страницы
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", 256))
+
+
+def page_cache_key(page_hash: str, language: str, system_prompt: str) -> str:
+    """Text of a page depends on the page image, the answer language, the model and the prompt."""
+    material = {
+        "page": page_hash,
+        "language": language,
+        "model": settings.model,
+        "prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PageCache(SizeBoundedStore):
+    """Persistent store of extracted text per page image, with size-based LRU eviction."""
+
+    def __init__(self, path: Optional[str] = PAGE_CACHE_PATH, max_mb: float = PAGE_CACHE_MAX_MB,
+                 enabled: bool = PAGE_CACHE_ENABLED):
+        super().__init__("Page cache", path, table="pages", column="text", max_mb=max_mb, enabled=enabled)
+
+
+page_cache = PageCache()
+# Модуль грузится вместе с экстракторами pdf/png, поэтому регистрирует счетчики сам
+register_stats("page_cache", page_cache.get_stats)
+
+
+def _contiguous_runs(indices: List[int]) -> List[List[int]]:
+    runs: List[List[int]] = []
+    for index in indices:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+async def _ocr_pages(indices: List[int], images: List[str]) -> Dict[int, Tuple[str, float, int]]:
+    """Runs tesseract on the given pages in the CPU pool; pages where OCR failed are left out."""
+    async with cpu_request():
+        with observe_stage("ocr"):
+            results = await asyncio.gather(
+                *(run_cpu_bound(ocr_page, images[index]) for index in indices), return_exceptions=True
+            )
+    recognized = {}
+    for index, result in zip(indices, results):
+        ocr_stats["pages"] += 1
+        if isinstance(result, Exception):
+            # Ошибка OCR (или переполненный пул) - страница просто уходит в vision-модель
+            ocr_stats["failed"] += 1
+            logger.warning(f"OCR failed for page {index + 1}: {result}")
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        recognized[index] = result
+    return recognized
+
+
+async def extract_page_texts(
+    images: List[str],
+    page_hashes: List[str],
+    language: str,
+    prompt: str = "Please extract text from these pictures.",
+    ocr_images: Optional[List[str]] = None
+) -> Tuple[List[Optional[str]], List[str], List[AIResponse]]:
+    """
+    Извлекает текст страниц: сначала кэш страниц, затем локальный OCR, и только
+    оставшиеся страницы (OCR с низкой уверенностью) отправляются в vision-модель.
+
+    Args:
+        images: Страницы как data URL
+        page_hashes: page_image_hash каждой страницы
+        language: Язык ответа
+        prompt: Текст пользовательской части запроса
+        ocr_images: Изображения для OCR, если отличаются от images (например, исходные PNG)
+
+    Returns:
+        Текст каждой страницы (внутренняя часть <extracted_text>), источник каждой страницы
+        ("page_cache", "ocr", "vision" или "ocr_fallback") и ответы модели. Если кэш отключен,
+        подряд идущие страницы для vision-модели уходят одним запросом, и их общий текст
+        стоит на месте первой из них.
+    """
+    system_prompt = get_extract_text_png_sys_prompt(language)
+    texts: List[Optional[str]] = [None] * len(images)
+    sources = ["vision"] * len(images)
+
+    keys: List[str] = []
+    if page_cache.enabled:
+        keys = [page_cache_key(page_hash, language, system_prompt) for page_hash in page_hashes]
+        cached = await page_cache.get_many(list(set(keys)))
+        for index, key in enumerate(keys):
+            if key in cached:
+                texts[index], sources[index] = cached[key], "page_cache"
+
+    pending = [index for index, source in enumerate(sources) if source == "vision"]
+    recognized: Dict[int, Tuple[str, float, int]] = {}
+    if pending and ocr_enabled():
+        recognized = await _ocr_pages(pending, ocr_images or images)
+        for index, (text, confidence, words) in recognized.items():
+            if accept_ocr(confidence, words):
+                texts[index], sources[index] = text, "ocr"
+                ocr_stats["accepted"] += 1
+            else:
+                ocr_stats["escalated"] += 1
+        pending = [index for index in pending if sources[index] == "vision"]
+
+    # Группы страниц для vision-модели: (страницы группы, страницы в запросе)
+    if page_cache.enabled:
+        # По одной странице на запрос: так ответ однозначно относится к странице и его можно кэшировать;
+        # одинаковые страницы внутри документа отправляются один раз
+        by_key: Dict[str, List[int]] = {}
+        for index in pending:
+            by_key.setdefault(keys[index], []).append(index)
+        groups = [(indices, indices[:1]) for indices in by_key.values()]
+    else:
+        groups = [(run, run) for run in _contiguous_runs(pending)]
+
+    results = await asyncio.gather(
+        *(openrouter_prompt(
+            system_prompt=system_prompt,
+            contents=get_png_payload(prompt=prompt, images_base64=[images[index] for index in sent]),
+        ) for _, sent in groups),
+        return_exceptions=True
+    )
+
+    responses: List[AIResponse] = []
+    extracted: Dict[str, str] = {}
+    for (indices, sent), result in zip(groups, results):
+        if isinstance(result, Exception):
+            # Провайдер недоступен: если у всех страниц группы есть хоть какой-то текст OCR, отдаем его
+            if not all(recognized.get(index, ("", 0.0, 0))[2] for index in indices):
+                raise result
+            logger.warning(f"Vision extraction failed, using low-confidence OCR for pages {[i + 1 for i in indices]}: {result}")
+            for index in indices:
+                texts[index], sources[index] = recognized[index][0], "ocr_fallback"
+            ocr_stats["fallbacks"] += len(indices)
+            continue
+        if isinstance(result, BaseException):
+            raise result
+
+        responses.append(result)
+        text = strip_extracted_text_root(result.response)
+        if page_cache.enabled:
+            extracted[keys[indices[0]]] = text
+            for index in indices:
+                texts[index] = text
+        else:
+            texts[indices[0]] = text
+
+    await page_cache.set_many(extracted)
+    return texts, sources, responses
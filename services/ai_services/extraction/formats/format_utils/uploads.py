@@ -0,0 +1,176 @@
+import os
+import asyncio
+import logging
+import tempfile
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.metrics import observe_stage
+from services.ai_services.extraction.formats.format_utils.format_utils import DocumentSource
+from services.ai_services.extraction.formats.format_utils.validators import MAX_FILE_SIZE_MB
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Загрузка читается кусками этого размера, в памяти одновременно не больше одного куска
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Файлы до этого размера остаются в памяти, большие сбрасываются во временный файл
+UPLOAD_SPOOL_MAX_MEMORY_MB = float(os.getenv("UPLOAD_SPOOL_MAX_MEMORY_MB", 1))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+# Ограничение всего multipart-запроса (несколько файлов в /extract/txt)
+MAX_REQUEST_SIZE_MB = float(os.getenv("MAX_REQUEST_SIZE_MB", MAX_FILE_SIZE_MB * 5))
+
+
+def _too_big(filename: Optional[str], max_size_mb: float) -> HTTPException:
+    logger.warning(f"File {filename} exceeds size limit")
+    return HTTPException(
+        status_code=400,
+        detail=f"File {filename} is too big. Max size: {max_size_mb:g}MB"
+    )
+
+
+class SpooledUpload:
+    """
+    Загруженный файл: байты для небольших файлов, путь к временному файлу для больших.
+
+    `source` передается в функции format_utils, которые принимают DocumentSource:
+    путь уходит в pdf2image/python-docx/PyPDF2 без копии содержимого в памяти
+    и без копирования при передаче в пул процессов.
+    """
+
+    def __init__(self, filename: Optional[str], data: Optional[bytes] = None, path: Optional[str] = None, size: int = 0):
+        self.filename = filename
+        self.data = data
+        self.path = path
+        self.size = size
+
+    @property
+    def source(self) -> DocumentSource:
+        return self.path if self.path is not None else self.data
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def close(self) -> None:
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+        self.data = None
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+async def spool_upload(file: UploadFile, max_size_mb: float = MAX_FILE_SIZE_MB) -> SpooledUpload:
+    """
+    Читает загрузку кусками и прерывает чтение, как только превышен лимит размера.
+
+    Args:
+        file: Загруженный файл
+        max_size_mb: Максимальный размер файла в МБ
+
+    Returns:
+        SpooledUpload, который нужно закрыть после обработки
+
+    Raises:
+        HTTPException: Если файл больше max_size_mb (UploadFile.size может отсутствовать)
+    """
+    limit = int(max_size_mb * 1024 * 1024)
+    memory_limit = int(UPLOAD_SPOOL_MAX_MEMORY_MB * 1024 * 1024)
+    buffer = bytearray()
+    spool = None
+    size = 0
+    with observe_stage("upload_read"):
+        try:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    raise _too_big(file.filename, max_size_mb)
+
+                if spool is None and len(buffer) + len(chunk) <= memory_limit:
+                    buffer += chunk
+                    continue
+                if spool is None:
+                    spool = tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_TMP_DIR, delete=False)
+                    await asyncio.to_thread(spool.write, bytes(buffer))
+                    buffer = bytearray()
+                await asyncio.to_thread(spool.write, chunk)
+        except BaseException:
+            if spool is not None:
+                spool.close()
+                os.unlink(spool.name)
+            raise
+
+    if spool is None:
+        return SpooledUpload(file.filename, data=bytes(buffer), size=size)
+    spool.close()
+    return SpooledUpload(file.filename, path=spool.name, size=size)
+
+
+async def read_upload(file: UploadFile, max_size_mb: float = MAX_FILE_SIZE_MB) -> bytes:
+    """
+    Читает загрузку целиком в память с тем же лимитом, что и spool_upload.
+
+    Нужен там, где содержимое все равно хранится как байты (задачи в SQLite).
+    """
+    upload = await spool_upload(file, max_size_mb)
+    try:
+        if not upload.on_disk:
+            return upload.data
+        with open(upload.path, "rb") as f:
+            return await asyncio.to_thread(f.read)
+    finally:
+        upload.close()
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Отклоняет multipart-запросы больше MAX_REQUEST_SIZE_MB еще до разбора тела.
+
+    Starlette сохраняет все части формы до вызова обработчика, поэтому без этой проверки
+    слишком большой файл был бы сначала целиком принят и записан, а потом отвергнут.
+    """
+
+    def __init__(self, app, max_size_mb: float = MAX_REQUEST_SIZE_MB):
+        self.app = app
+        self.max_size_mb = max_size_mb
+        self.limit = int(max_size_mb * 1024 * 1024)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        detail = f"Request body is too big. Max size: {self.max_size_mb:g}MB"
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.limit:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # Тело без Content-Length (chunked): обрываем чтение на первом лишнем куске
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
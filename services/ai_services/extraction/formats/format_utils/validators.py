@@ -1,6 +1,7 @@
 import logging
 from fastapi import HTTPException, UploadFile
 from typing import List, Optional, Dict, Any, Union
+from services.ai_services.ai_utils.metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 
@@ -72,8 +73,9 @@ def validate_file(file: UploadFile, file_type: str, max_size_mb: int = MAX_FILE_
     Raises:
         HTTPException: При ошибках валидации
     """
-    validate_file_size(file, max_size_mb)
-    validate_file_type(file, file_type)
+    with observe_stage("validation"):
+        validate_file_size(file, max_size_mb)
+        validate_file_type(file, file_type)
 
 def handle_extraction_error(e: Exception, file_type: str) -> None:
     """
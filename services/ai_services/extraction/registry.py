@@ -0,0 +1,54 @@
+import os
+import importlib
+from typing import Awaitable, Callable, Dict, List
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.utils import AIResponse
+
+load_dotenv()
+
+# Формат -> модуль с маршрутом /extract/<формат> и функцией process_<формат>.
+# Модуль импортируется только для включенных форматов; тяжелые библиотеки
+# (pdf2image, PyPDF2, pytesseract) внутри него грузятся при первом документе.
+EXTRACTORS: Dict[str, str] = {
+    "pdf": "services.ai_services.extraction.formats.extract_pdf",
+    "doc": "services.ai_services.extraction.formats.extract_doc",
+    "txt": "services.ai_services.extraction.formats.extract_txt",
+    "png": "services.ai_services.extraction.formats.extract_png",
+}
+
+# Форматы через запятую: для остальных не подключаются /extract/<формат>,
+# а /jobs/extract/<формат> и /pipeline/<формат> отвечают 404
+ENABLED_EXTRACTORS = [
+    name.strip() for name in os.getenv("ENABLED_EXTRACTORS", ",".join(EXTRACTORS)).split(",") if name.strip()
+]
+
+_unknown = [name for name in ENABLED_EXTRACTORS if name not in EXTRACTORS]
+if _unknown:
+    raise ValueError(f"Unknown extractors in ENABLED_EXTRACTORS: {', '.join(_unknown)}")
+
+
+def enabled_extractors() -> List[str]:
+    return [name for name in EXTRACTORS if name in ENABLED_EXTRACTORS]
+
+
+def load_extractor_routes() -> None:
+    """Imports the enabled extractor modules so their routes register on the /extract router."""
+    for name in enabled_extractors():
+        importlib.import_module(EXTRACTORS[name])
+
+
+def require_extractor(name: str) -> None:
+    if name not in ENABLED_EXTRACTORS:
+        raise HTTPException(status_code=404, detail=f"Extractor '{name}' is not enabled on this server")
+
+
+def get_processor(name: str) -> Callable[..., Awaitable[AIResponse]]:
+    """
+    Возвращает process_<формат> включенного экстрактора, импортируя модуль при первом вызове.
+
+    Raises:
+        HTTPException: 404, если формат не включен в ENABLED_EXTRACTORS
+    """
+    require_extractor(name)
+    return getattr(importlib.import_module(EXTRACTORS[name]), f"process_{name}")
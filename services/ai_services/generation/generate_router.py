@@ -1,28 +1,130 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator
+import asyncio
+import json
+import logging
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 
-from services.ai_services.ai_utils.utils import AIResponse, AIRequest
-from services.ai_services.ai_utils.openrouter_prompt import openrouter_prompt
-from services.ai_services.ai_utils.system_prompts import get_summary_sys_prompt, get_test_sys_prompt
+from services.ai_services.ai_utils.utils import AIResponse, AIRequest, BatchItem, BatchRequest
+from services.ai_services.ai_utils.backends import backend_router
+from services.ai_services.ai_utils.streaming import stream_events
+from services.ai_services.ai_utils.system_prompts import get_summary_sys_prompt, get_test_sys_prompt, get_merge_summary_sys_prompt
+from services.ai_services.ai_utils.long_document import is_long_text, reduce_partial_summaries, summarize_text
+from services.ai_services.generation.question_pool import question_pool, PoolStatus
 # Создаем роутер для обработки запросов к /generate
 
 
 router = APIRouter(prefix="/generate", tags=["generate"])
 
+logger = logging.getLogger(__name__)
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+
+
+def _backend():
+    # Выбор провайдера, failover и хеджирование - в backend_router (LLM_BACKENDS, LLM_ROUTING_POLICY)
+    return backend_router.prompt, backend_router.prompt_stream
+
+
+async def _generate(system_prompt: str, request: AIRequest):
+    prompt, prompt_stream = _backend()
+
+    if request.stream:
+        return await stream_events(prompt_stream(system_prompt=system_prompt, contents=request.text))
+
+    return await prompt(system_prompt=system_prompt, contents=request.text, use_cache=request.use_cache)
+
+
 @router.post("/summary", response_model=AIResponse)
 async def generate_summary(request: AIRequest):
-    
-    return await openrouter_prompt(
+    if is_long_text(request.text):
+        prompt, prompt_stream = _backend()
+        if request.stream:
+            # Куски суммаризируются заранее, в поток идет только финальное слияние
+            merged_input, _ = await reduce_partial_summaries(request.text, request.language, prompt, request.use_cache)
+            return await stream_events(prompt_stream(
+                system_prompt=get_merge_summary_sys_prompt(request.language),
+                contents=merged_input))
+        return await summarize_text(request.text, request.language, prompt, request.use_cache)
+
+    return await _generate(
         system_prompt=get_summary_sys_prompt(request.language),
-        contents=request.text)
-   
-   
+        request=request)
+
+
 @router.post("/test", response_model=AIResponse)
 async def generate_test(request: AIRequest):
+    use_pool = request.question_pool and question_pool.enabled and not request.stream
+    if use_pool:
+        pooled = await question_pool.take(request.text, request.language, request.num_questions)
+        if pooled is not None:
+            return pooled
 
-    return await openrouter_prompt(
+    result = await _generate(
         system_prompt=get_test_sys_prompt(language=request.language, num_questions=request.num_questions),
-        contents=request.text)
+        request=request)
+    if use_pool:
+        # Пока пул наполняется, вопросы обычного ответа тоже идут в него
+        await question_pool.add_test(request.text, request.language, result.response)
+    return result
+
+
+@router.post("/test/pool", response_model=PoolStatus, status_code=202)
+async def generate_test_pool(request: AIRequest):
+    """Starts generating a question pool for the summary in request.text; /generate/test with question_pool=true samples from it."""
+    if not question_pool.enabled:
+        raise HTTPException(status_code=404, detail="Question pools are disabled on this server")
+    return await question_pool.warm(request.text, request.language)
+
+
+async def _run_batch_item(index: int, item: BatchItem, semaphore: asyncio.Semaphore) -> dict:
+    line = {"index": index, "id": item.id, "operation": item.operation}
+    async with semaphore:
+        try:
+            request = AIRequest(**item.model_dump(exclude={"operation", "id"}) | {"stream": False})
+            handler = generate_summary if item.operation == "summary" else generate_test
+            result = await handler(request)
+            return {**line, "status": "ok", "result": result.model_dump()}
+        except HTTPException as he:
+            return {**line, "status": "error", "error": {"status_code": he.status_code, "detail": he.detail}}
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}", exc_info=True)
+            return {**line, "status": "error", "error": {"status_code": 500, "detail": str(e)}}
+
+
+async def _stream_batch(request: BatchRequest, concurrency: int) -> AsyncIterator[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.create_task(_run_batch_item(i, item, semaphore)) for i, item in enumerate(request.items)]
+    succeeded = 0
+    try:
+        # Строки отдаются по мере готовности, порядок - по index
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            succeeded += line["status"] == "ok"
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "succeeded": succeeded, "failed": len(tasks) - succeeded}) + "\n"
+    finally:
+        # Клиент отключился - не тратим квоту на оставшиеся элементы
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/batch")
+async def generate_batch(request: BatchRequest):
+    """Runs many summary/test requests with server-side concurrency, streaming NDJSON lines as items finish."""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is too big: {len(request.items)} items. Max items: {BATCH_MAX_ITEMS}"
+        )
+
+    concurrency = min(max(request.concurrency or BATCH_CONCURRENCY, 1), BATCH_MAX_CONCURRENCY)
+    return StreamingResponse(_stream_batch(request, concurrency), media_type="application/x-ndjson")
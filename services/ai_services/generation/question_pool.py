@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.utils import AIResponse
+from services.ai_services.ai_utils.http_client import settings
+from services.ai_services.ai_utils.backends import backend_router, LLM_BACKENDS
+from services.ai_services.ai_utils.metrics import register_stats
+from services.ai_services.ai_utils.system_prompts import get_question_pool_sys_prompt
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "true").lower() == "true"
+QUESTION_POOL_PATH = os.getenv("QUESTION_POOL_PATH", ".cache/question_pool.sqlite3")
+# Сколько "свежих" вопросов держать в пуле одной суммаризации
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", 60))
+# Вопросов на один запрос к модели при наполнении пула
+QUESTION_POOL_BATCH = int(os.getenv("QUESTION_POOL_BATCH", 10))
+# Вопрос, выданный столько раз, больше не считается свежим (студенты начинают видеть повторы)
+QUESTION_POOL_MAX_SERVES = int(os.getenv("QUESTION_POOL_MAX_SERVES", 20))
+# Пул пополняется в фоне, когда свежих вопросов становится меньше этой доли QUESTION_POOL_SIZE
+QUESTION_POOL_LOW_RATIO = float(os.getenv("QUESTION_POOL_LOW_RATIO", 0.5))
+# Всего вопросов на суммаризацию; дальше пул не растет, а выдаются наименее использованные
+QUESTION_POOL_MAX_QUESTIONS = int(os.getenv("QUESTION_POOL_MAX_QUESTIONS", 300))
+# Пулы, которыми не пользовались столько дней, удаляются
+QUESTION_POOL_TTL_DAYS = float(os.getenv("QUESTION_POOL_TTL_DAYS", 30))
+# Пока идет наполнение, пул закреплен за одним процессом; после сбоя процесса закрепление истекает
+QUESTION_POOL_LEASE_SECONDS = float(os.getenv("QUESTION_POOL_LEASE_SECONDS", 300))
+
+# Вопросы с таким сходством по словам (коэффициент Жаккара) считаются повторами
+_DUPLICATE_SIMILARITY = 0.8
+# Наполнение останавливается после стольких запросов подряд без новых вопросов
+_MAX_BARREN_BATCHES = 2
+# Сколько уже имеющихся вопросов перечислять модели, чтобы она их не повторяла
+_MAX_EXISTING_IN_PROMPT = 100
+
+_QUESTION_RE = re.compile(r"<question>.*?</question>", re.DOTALL)
+_QUESTION_TEXT_RE = re.compile(r"<question>\s*<text>(.*?)</text>", re.DOTALL)
+_ANSWER_RE = re.compile(r"<answer>.*?<is_correct>\s*(true|false)\s*</is_correct>\s*</answer>", re.DOTALL | re.IGNORECASE)
+_WORD_RE = re.compile(r"\w+")
+
+
+class PoolStatus(BaseModel):
+    pool_id: str
+    questions: int
+    fresh: int
+    target: int
+    filling: bool
+
+
+def pool_key(summary: str, language: str) -> str:
+    """Questions depend on the summary text, the answer language and the model."""
+    material = {
+        "summary": hashlib.sha256(" ".join(summary.split()).encode("utf-8")).hexdigest(),
+        "language": language,
+        "backends": LLM_BACKENDS,
+        "model": settings.model,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _words(text: str) -> Set[str]:
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def parse_questions(test_xml: str) -> List[Tuple[str, str]]:
+    """
+    Извлекает вопросы из ответа модели в формате get_test_sys_prompt.
+
+    Returns:
+        Пары (текст вопроса, XML <question>) для вопросов с единственным правильным ответом
+    """
+    questions = []
+    for match in _QUESTION_RE.finditer(test_xml):
+        question = match.group(0)
+        text = _QUESTION_TEXT_RE.search(question)
+        answers = [flag.lower() for flag in _ANSWER_RE.findall(question)]
+        if text is None or len(answers) < 2 or answers.count("true") != 1:
+            continue
+        questions.append((" ".join(text.group(1).split()), question))
+    return questions
+
+
+class QuestionPool:
+    """
+    Пулы вопросов по суммаризациям в SQLite.
+
+    Пул наполняется в фоне пачками по QUESTION_POOL_BATCH вопросов без повторов,
+    а тест собирается из пула локально: выбираются наименее выданные вопросы.
+    """
+
+    def __init__(self, path: Optional[str] = QUESTION_POOL_PATH, enabled: bool = QUESTION_POOL_ENABLED):
+        self.path = path
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.owner = os.urandom(8).hex()
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        self.stats = {
+            "requests": 0,
+            "served": 0,
+            "misses": 0,
+            "fills": 0,
+            "generation_calls": 0,
+            "generated": 0,
+            "duplicates": 0,
+            "failed_fills": 0,
+        }
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pools ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, language TEXT NOT NULL, "
+                "lease_owner TEXT, lease_until REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                "pool_key TEXT NOT NULL, hash TEXT NOT NULL, text TEXT NOT NULL, xml TEXT NOT NULL, "
+                "served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, PRIMARY KEY (pool_key, hash))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS questions_served ON questions(pool_key, served)")
+            self._conn.commit()
+        return self._conn
+
+    # --- SQLite ---
+
+    def _ensure_pool(self, key: str, summary: str, language: str) -> None:
+        with self._lock:
+            conn = self._get_conn()
+            now = time.time()
+            created = conn.execute(
+                "INSERT OR IGNORE INTO pools (key, summary, language, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, summary, language, now, now)
+            ).rowcount
+            if created:
+                # Новый пул - хороший момент убрать заброшенные
+                expired = now - QUESTION_POOL_TTL_DAYS * 86400
+                conn.execute("DELETE FROM questions WHERE pool_key IN (SELECT key FROM pools WHERE last_used_at < ?)", (expired,))
+                conn.execute("DELETE FROM pools WHERE last_used_at < ?", (expired,))
+            conn.commit()
+
+    def _counts(self, key: str) -> Tuple[int, int]:
+        with self._lock:
+            total, fresh = self._get_conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(served < ?), 0) FROM questions WHERE pool_key = ?",
+                (QUESTION_POOL_MAX_SERVES, key)
+            ).fetchone()
+        return total, fresh
+
+    def _sample(self, key: str, count: int) -> List[str]:
+        """Takes the `count` least served questions (random among equals) and marks them served."""
+        with self._lock:
+            conn = self._get_conn()
+            rows = conn.execute(
+                "SELECT hash, xml FROM questions WHERE pool_key = ? ORDER BY served, RANDOM() LIMIT ?", (key, count)
+            ).fetchall()
+            if len(rows) < count:
+                return []
+            conn.executemany(
+                "UPDATE questions SET served = served + 1 WHERE pool_key = ? AND hash = ?",
+                [(key, question_hash) for question_hash, _ in rows]
+            )
+            conn.execute("UPDATE pools SET last_used_at = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        return [xml for _, xml in rows]
+
+    def _existing(self, key: str) -> List[str]:
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT text FROM questions WHERE pool_key = ? ORDER BY created_at DESC", (key,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def _add(self, key: str, questions: List[Tuple[str, str]]) -> int:
+        """Adds questions that are not duplicates of the pool or of each other. Returns how many were added."""
+        with self._lock:
+            conn = self._get_conn()
+            known = [_words(row[0]) for row in conn.execute("SELECT text FROM questions WHERE pool_key = ?", (key,))]
+            now = time.time()
+            added = 0
+            for text, xml in questions:
+                words = _words(text)
+                if not words or any(len(words & other) / len(words | other) >= _DUPLICATE_SIMILARITY for other in known):
+                    self.stats["duplicates"] += 1
+                    continue
+                question_hash = hashlib.sha256(" ".join(sorted(words)).encode("utf-8")).hexdigest()
+                added += conn.execute(
+                    "INSERT OR IGNORE INTO questions (pool_key, hash, text, xml, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, question_hash, text, xml, now)
+                ).rowcount
+                known.append(words)
+            conn.commit()
+        return added
+
+    def _lease(self, key: str, release: bool = False) -> bool:
+        """Takes (or releases) the right to fill the pool; only one process fills a pool at a time."""
+        with self._lock:
+            conn = self._get_conn()
+            if release:
+                conn.execute("UPDATE pools SET lease_until = 0 WHERE key = ? AND lease_owner = ?", (key, self.owner))
+                conn.commit()
+                return True
+            now = time.time()
+            taken = conn.execute(
+                "UPDATE pools SET lease_owner = ?, lease_until = ? WHERE key = ? AND (lease_until < ? OR lease_owner = ?)",
+                (self.owner, now + QUESTION_POOL_LEASE_SECONDS, key, now, self.owner)
+            ).rowcount
+            conn.commit()
+        return taken == 1
+
+    # --- Наполнение ---
+
+    async def _generate_batch(self, key: str, summary: str, language: str) -> int:
+        existing = await asyncio.to_thread(self._existing, key)
+        contents = summary
+        if existing:
+            listed = "\n".join(f"- {text}" for text in existing[:_MAX_EXISTING_IN_PROMPT])
+            contents = f"{summary}\n\n<existing_questions>\n{listed}\n</existing_questions>"
+        # Без кэша ответов: одинаковый запрос иначе вернул бы те же вопросы
+        result = await backend_router.prompt(
+            system_prompt=get_question_pool_sys_prompt(language=language, num_questions=QUESTION_POOL_BATCH),
+            contents=contents,
+            use_cache=False
+        )
+        self.stats["generation_calls"] += 1
+        added = await asyncio.to_thread(self._add, key, parse_questions(result.response))
+        self.stats["generated"] += added
+        return added
+
+    async def _fill(self, key: str, summary: str, language: str) -> None:
+        if not await asyncio.to_thread(self._lease, key):
+            return
+        self.stats["fills"] += 1
+        barren = 0
+        try:
+            while barren < _MAX_BARREN_BATCHES:
+                total, fresh = await asyncio.to_thread(self._counts, key)
+                if fresh >= QUESTION_POOL_SIZE or total >= QUESTION_POOL_MAX_QUESTIONS:
+                    break
+                added = await self._generate_batch(key, summary, language)
+                # Суммаризация исчерпана (или слишком короткая для теста)
+                barren = barren + 1 if added == 0 else 0
+                await asyncio.to_thread(self._lease, key)
+            total, fresh = await asyncio.to_thread(self._counts, key)
+            logger.info(f"Question pool {key[:12]}: {total} questions, {fresh} fresh")
+        except Exception as e:
+            self.stats["failed_fills"] += 1
+            logger.warning(f"Question pool {key[:12]} fill failed: {e}")
+        finally:
+            await asyncio.to_thread(self._lease, key, True)
+
+    def _schedule_fill(self, key: str, summary: str, language: str) -> None:
+        if key in self._tasks:
+            return
+        task = asyncio.create_task(self._fill(key, summary, language))
+        self._tasks[key] = task
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+    # --- Публичный интерфейс ---
+
+    async def warm(self, summary: str, language: str) -> PoolStatus:
+        """Creates the pool for a summary if needed and starts filling it in the background."""
+        key = pool_key(summary, language)
+        await asyncio.to_thread(self._ensure_pool, key, summary, language)
+        total, fresh = await asyncio.to_thread(self._counts, key)
+        if fresh < QUESTION_POOL_SIZE and total < QUESTION_POOL_MAX_QUESTIONS:
+            self._schedule_fill(key, summary, language)
+        return PoolStatus(pool_id=key, questions=total, fresh=fresh, target=QUESTION_POOL_SIZE, filling=key in self._tasks)
+
+    async def take(self, summary: str, language: str, num_questions: int) -> Optional[AIResponse]:
+        """
+        Собирает тест из пула.
+
+        Args:
+            summary: Текст суммаризации
+            language: Язык ответа
+            num_questions: Число вопросов в тесте
+
+        Returns:
+            AIResponse с тестом в формате <test>, или None, если вопросов в пуле пока не хватает
+            (пул при этом наполняется в фоне)
+        """
+        self.stats["requests"] += 1
+        key = pool_key(summary, language)
+        await asyncio.to_thread(self._ensure_pool, key, summary, language)
+        questions = await asyncio.to_thread(self._sample, key, num_questions)
+        total, fresh = await asyncio.to_thread(self._counts, key)
+        if fresh < max(QUESTION_POOL_SIZE * QUESTION_POOL_LOW_RATIO, num_questions) and total < QUESTION_POOL_MAX_QUESTIONS:
+            self._schedule_fill(key, summary, language)
+        if not questions:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["served"] += 1
+        random.shuffle(questions)
+        return AIResponse(
+            response="<test>\n" + "\n".join(questions) + "\n</test>",
+            raw_response={"question_pool": {"pool_id": key, "questions": total, "fresh": fresh}}
+        )
+
+    async def add_test(self, summary: str, language: str, test_xml: str) -> int:
+        """Adds the questions of a test generated the usual way, so a cold pool is not wasted work."""
+        key = pool_key(summary, language)
+        await asyncio.to_thread(self._ensure_pool, key, summary, language)
+        return await asyncio.to_thread(self._add, key, parse_questions(test_xml))
+
+    async def stop(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "filling": len(self._tasks)}
+
+
+question_pool = QuestionPool()
+register_stats("question_pool", question_pool.get_stats)
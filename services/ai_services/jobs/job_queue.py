@@ -0,0 +1,216 @@
+import os
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from fastapi import HTTPException
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.utils import AIResponse, AIRequest
+from services.ai_services.extraction.registry import get_processor
+from services.ai_services.generation.generate_router import generate_summary, generate_test
+from services.ai_services.jobs.job_store import JobStore, JobStatus, DONE, FAILED
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 4))
+# Максимум ожидающих задач; сверх - 429, чтобы клиент повторил позже
+JOBS_MAX_QUEUE = int(os.getenv("JOBS_MAX_QUEUE", 100))
+# Процесс отмечается в базе с этим интервалом; задачи процесса без отметки 3 интервала перезапускаются
+JOBS_HEARTBEAT_SECONDS = float(os.getenv("JOBS_HEARTBEAT_SECONDS", 10))
+# Как часто long polling проверяет базу: задачу мог выполнить другой процесс
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", 0.5))
+# Сколько при остановке ждать выполняющиеся задачи, прежде чем прервать их
+JOBS_DRAIN_TIMEOUT = float(os.getenv("JOBS_DRAIN_TIMEOUT", 60))
+
+JobHandler = Callable[[Dict[str, Any], List[bytes]], Awaitable[AIResponse]]
+
+
+async def _generate(handler, params: Dict[str, Any]) -> AIResponse:
+    # В задачах результат сохраняется целиком, поэтому потоковая выдача не нужна
+    return await handler(AIRequest(**{**params, "stream": False}))
+
+
+OPERATIONS: Dict[str, JobHandler] = {
+    "extract/pdf": lambda params, files: get_processor("pdf")(files[0], **params),
+    "extract/doc": lambda params, files: get_processor("doc")(files[0], **params),
+    "extract/txt": lambda params, files: get_processor("txt")(files, **params),
+    "extract/png": lambda params, files: get_processor("png")(**params),
+    "generate/summary": lambda params, files: _generate(generate_summary, params),
+    "generate/test": lambda params, files: _generate(generate_test, params),
+}
+
+
+class JobQueue:
+    """Bounded worker pool executing jobs from the persistent store."""
+
+    def __init__(self, store: JobStore, workers: int = JOBS_WORKERS, max_queue: int = JOBS_MAX_QUEUE):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.worker_id = uuid.uuid4().hex
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._busy: Set[asyncio.Task] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._draining = False
+        self._finished: Dict[str, asyncio.Event] = {}
+        # Сколько get() ждут каждое событие: последний удаляет его, если задача выполняется не здесь
+        self._waiters: Dict[str, int] = {}
+
+    def _enqueue(self, job_id: str) -> None:
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _recover(self) -> int:
+        # Задачи упавших процессов и ничьи задачи из очереди; двойной захват исключает store.claim
+        pending = await asyncio.to_thread(self.store.requeue_orphaned, JOBS_HEARTBEAT_SECONDS * 3)
+        for job_id in pending:
+            self._enqueue(job_id)
+        return len(pending)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(JOBS_HEARTBEAT_SECONDS)
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.worker_id)
+                await self._recover()
+            except Exception as e:
+                logger.warning(f"Job heartbeat failed: {e}")
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.store.heartbeat, self.worker_id)
+        purged = await asyncio.to_thread(self.store.purge_finished)
+        pending = await self._recover()
+        if pending or purged:
+            logger.info(f"Jobs: {pending} resumed after restart, {purged} expired removed")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self, drain_timeout: float = JOBS_DRAIN_TIMEOUT) -> None:
+        """Lets running jobs finish for up to drain_timeout; queued ones stay in the store for other workers."""
+        self._draining = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        busy = set(self._busy)
+        for task in self._tasks:
+            if task not in busy:
+                task.cancel()
+        if busy:
+            logger.info(f"Jobs: waiting up to {drain_timeout:g}s for {len(busy)} running jobs")
+            await asyncio.wait(busy, timeout=drain_timeout)
+        # Прерванные задачи остаются в статусе running и перезапускаются, когда пропадет отметка процесса
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *filter(None, [self._heartbeat]), return_exceptions=True)
+        self._tasks = []
+        if not busy or all(task.done() for task in busy):
+            # Все задачи процесса завершены - перезапускать нечего, отметку можно убрать сразу
+            await asyncio.to_thread(self.store.remove_worker, self.worker_id)
+
+    async def submit(self, operation: str, params: Dict[str, Any], files: Optional[List[bytes]] = None) -> JobStatus:
+        if operation not in OPERATIONS:
+            raise HTTPException(status_code=404, detail=f"Unknown operation: {operation}")
+        if self._queue.qsize() >= self.max_queue:
+            raise HTTPException(
+                status_code=429,
+                detail="Job queue is full, please retry later",
+                headers={"Retry-After": "5"}
+            )
+        job = await asyncio.to_thread(self.store.create, operation, params, files)
+        self._enqueue(job.id)
+        return job
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[JobStatus]:
+        """Returns job status, waiting up to `wait` seconds for it to finish (long polling)."""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or job.status in (DONE, FAILED) or wait <= 0:
+            return job
+        event = self._finished.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            # Задача могла завершиться (или быть удалена), пока создавалось событие
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job.status in (DONE, FAILED):
+                return job
+            deadline = asyncio.get_running_loop().time() + wait
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    return job
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(remaining, JOBS_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                # Событие срабатывает только для задач этого процесса, остальные видны в базе
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is None or job.status in (DONE, FAILED):
+                    return job
+        finally:
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                if self._finished.get(job_id) is event:
+                    del self._finished[job_id]
+
+    async def _worker(self) -> None:
+        while not self._draining:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            self._busy.add(asyncio.current_task())
+            try:
+                await self._run(job_id)
+            finally:
+                self._busy.discard(asyncio.current_task())
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or self._draining:
+            return
+        if not await asyncio.to_thread(self.store.claim, job_id, self.worker_id):
+            # Задачу уже выполняет другой процесс
+            return
+        params, files = await asyncio.to_thread(self.store.load_input, job_id)
+        try:
+            result = await OPERATIONS[job.operation](params, files)
+            await asyncio.to_thread(self.store.mark_done, job_id, result)
+        except asyncio.CancelledError:
+            raise
+        except HTTPException as he:
+            await asyncio.to_thread(self.store.mark_failed, job_id, {"status_code": he.status_code, "detail": he.detail})
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job.operation}) failed: {e}", exc_info=True)
+            await asyncio.to_thread(self.store.mark_failed, job_id, {"status_code": 500, "detail": str(e)})
+        finally:
+            event = self._finished.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+
+_job_queue: Optional[JobQueue] = None
+
+
+async def start_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(JobStore())
+        await _job_queue.start()
+    return _job_queue
+
+
+async def stop_job_queue() -> None:
+    global _job_queue
+    if _job_queue is not None:
+        await _job_queue.stop()
+        _job_queue.store.close()
+        _job_queue = None
+
+
+def get_job_queue() -> JobQueue:
+    if _job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue is not running")
+    return _job_queue
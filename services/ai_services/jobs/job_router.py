@@ -0,0 +1,87 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from typing import List, Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from services.ai_services.ai_utils.utils import AIRequest
+from services.ai_services.extraction.formats.format_utils.validators import validate_file
+from services.ai_services.extraction.formats.format_utils.uploads import read_upload
+from services.ai_services.extraction.registry import require_extractor
+from services.ai_services.jobs.job_store import JobStatus
+from services.ai_services.jobs.job_queue import get_job_queue
+
+# Асинхронные задачи: ответ с id сразу, результат - опросом /jobs/{id}
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# Максимальное время long polling
+JOBS_MAX_WAIT_SECONDS = float(os.getenv("JOBS_MAX_WAIT_SECONDS", 30))
+
+
+@router.post("/extract/pdf", response_model=JobStatus, status_code=202)
+async def submit_extract_pdf(
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    first_page: Optional[int] = Form(None),
+    last_page: Optional[int] = Form(None),
+    summarize: Optional[bool] = Form(False)
+):
+    require_extractor("pdf")
+    validate_file(file, "pdf")
+    params = {"language": language, "first_page": first_page, "last_page": last_page, "summarize": bool(summarize)}
+    return await get_job_queue().submit("extract/pdf", params, [await read_upload(file)])
+
+
+@router.post("/extract/doc", response_model=JobStatus, status_code=202)
+async def submit_extract_doc(
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):
+    require_extractor("doc")
+    validate_file(file, "doc")
+    params = {"language": language, "summarize": bool(summarize)}
+    return await get_job_queue().submit("extract/doc", params, [await read_upload(file)])
+
+
+@router.post("/extract/txt", response_model=JobStatus, status_code=202)
+async def submit_extract_txt(
+    files: List[UploadFile] = File(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):
+    require_extractor("txt")
+    for file in files:
+        validate_file(file, "txt")
+    params = {"language": language, "summarize": bool(summarize)}
+    return await get_job_queue().submit("extract/txt", params, [await read_upload(file) for file in files])
+
+
+@router.post("/extract/png", response_model=JobStatus, status_code=202)
+async def submit_extract_png(
+    files: List[str] = Form(...),
+    language: str = Form("auto"),
+    summarize: Optional[bool] = Form(False)
+):
+    require_extractor("png")
+    params = {"files": files, "language": language, "summarize": bool(summarize)}
+    return await get_job_queue().submit("extract/png", params)
+
+
+@router.post("/generate/summary", response_model=JobStatus, status_code=202)
+async def submit_generate_summary(request: AIRequest):
+    return await get_job_queue().submit("generate/summary", request.model_dump())
+
+
+@router.post("/generate/test", response_model=JobStatus, status_code=202)
+async def submit_generate_test(request: AIRequest):
+    return await get_job_queue().submit("generate/test", request.model_dump())
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish")):
+    job = await get_job_queue().get(job_id, wait=min(wait, JOBS_MAX_WAIT_SECONDS))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
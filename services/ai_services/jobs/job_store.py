@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from dotenv import load_dotenv
+from services.ai_services.ai_utils.utils import AIResponse
+
+load_dotenv()
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ".cache/jobs.sqlite3")
+# Сколько хранить завершенные задачи
+JOBS_RETENTION_SECONDS = float(os.getenv("JOBS_RETENTION_SECONDS", 24 * 3600))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobStatus(BaseModel):
+    id: str
+    operation: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[AIResponse] = None
+    error: Optional[Dict[str, Any]] = None
+
+
+class JobStore:
+    """SQLite-backed job state; input files are kept as blobs until the job finishes."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, operation TEXT NOT NULL, params TEXT NOT NULL, status TEXT NOT NULL, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, owner TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+        # Несколько процессов (serve.py) работают с одной базой: задачу выполняет тот, кто ее захватил.
+        # Базы от прежних версий получают колонку owner; воркеры стартуют одновременно, поэтому
+        # колонку мог уже добавить соседний процесс
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            try:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):
+                    raise
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_workers (id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            "job_id TEXT NOT NULL, idx INTEGER NOT NULL, data BLOB NOT NULL, PRIMARY KEY (job_id, idx))"
+        )
+        self._conn.commit()
+
+    def create(self, operation: str, params: Dict[str, Any], files: Optional[List[bytes]] = None) -> JobStatus:
+        job = JobStatus(id=uuid.uuid4().hex, operation=operation, status=QUEUED, created_at=time.time())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, operation, params, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, operation, json.dumps(params), QUEUED, job.created_at)
+            )
+            self._conn.executemany(
+                "INSERT INTO job_files (job_id, idx, data) VALUES (?, ?, ?)",
+                [(job.id, idx, data) for idx, data in enumerate(files or [])]
+            )
+            self._conn.commit()
+        return job
+
+    def get(self, job_id: str) -> Optional[JobStatus]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, operation, status, created_at, started_at, finished_at, result, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return JobStatus(
+            id=row[0], operation=row[1], status=row[2], created_at=row[3], started_at=row[4], finished_at=row[5],
+            result=AIResponse.model_validate_json(row[6]) if row[6] else None,
+            error=json.loads(row[7]) if row[7] else None
+        )
+
+    def load_input(self, job_id: str) -> Tuple[Dict[str, Any], List[bytes]]:
+        with self._lock:
+            (params,) = self._conn.execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            files = [row[0] for row in self._conn.execute(
+                "SELECT data FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,)
+            )]
+        return json.loads(params), files
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """Atomically moves a queued job to running for `owner`. False if another worker took it first."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, owner = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), owner, job_id, QUEUED)
+            )
+            self._conn.commit()
+        return cursor.rowcount == 1
+
+    def _finish(self, job_id: str, status: str, result: Optional[str], error: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id)
+            )
+            self._conn.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def mark_done(self, job_id: str, result: AIResponse) -> None:
+        self._finish(job_id, DONE, result.model_dump_json(), None)
+
+    def mark_failed(self, job_id: str, error: Dict[str, Any]) -> None:
+        self._finish(job_id, FAILED, None, json.dumps(error, ensure_ascii=False))
+
+    def heartbeat(self, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO job_workers (id, heartbeat_at) VALUES (?, ?)", (worker_id, time.time())
+            )
+            self._conn.commit()
+
+    def remove_worker(self, worker_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM job_workers WHERE id = ?", (worker_id,))
+            self._conn.commit()
+
+    def requeue_orphaned(self, stale_after: float) -> List[str]:
+        """
+        Jobs interrupted mid-run by a worker that is gone (no heartbeat for `stale_after` seconds)
+        are queued again. Returns all queued job ids, oldest first.
+        """
+        with self._lock:
+            threshold = time.time() - stale_after
+            self._conn.execute("DELETE FROM job_workers WHERE heartbeat_at < ?", (threshold,))
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL WHERE status = ? "
+                "AND (owner IS NULL OR owner NOT IN (SELECT id FROM job_workers))",
+                (QUEUED, RUNNING)
+            )
+            self._conn.commit()
+            rows = self._conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_finished(self, older_than: float = JOBS_RETENTION_SECONDS) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (DONE, FAILED, time.time() - older_than)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,125 @@
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Awaitable, List, Optional
+import json
+import logging
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from services.ai_services.ai_utils.utils import AIRequest, AIResponse
+from services.ai_services.extraction.registry import get_processor
+from services.ai_services.extraction.formats.format_utils.validators import validate_file
+from services.ai_services.extraction.formats.format_utils.uploads import SpooledUpload, spool_upload
+from services.ai_services.generation.generate_router import generate_summary, generate_test
+
+# Извлечение -> суммаризация -> тест одним запросом, без возврата промежуточных данных клиенту
+router = APIRouter(prefix="/pipeline", tags=["pipeline"])
+
+logger = logging.getLogger(__name__)
+
+
+def _line(stage: str, **fields) -> str:
+    return json.dumps({"stage": stage, **fields}, ensure_ascii=False) + "\n"
+
+
+async def _run_pipeline(extraction: Awaitable[AIResponse], language: str, num_questions: int) -> AsyncIterator[str]:
+    """Runs the stages back to back, emitting one NDJSON line per finished stage."""
+    stage = "extract"
+    try:
+        extracted = await extraction
+        yield _line(stage, result=extracted.model_dump())
+
+        stage = "summary"
+        summary = await generate_summary(AIRequest(text=extracted.response, language=language))
+        yield _line(stage, result=summary.model_dump())
+
+        # Тест запускается сразу по готовности суммаризации, summary не покидает сервер
+        stage = "test"
+        test = await generate_test(AIRequest(text=summary.response, language=language, num_questions=num_questions))
+        yield _line(stage, result=test.model_dump())
+
+        yield _line("done")
+    except HTTPException as he:
+        yield _line(stage, error={"status_code": he.status_code, "detail": he.detail})
+    except Exception as e:
+        logger.error(f"Pipeline failed at stage {stage}: {e}", exc_info=True)
+        yield _line(stage, error={"status_code": 500, "detail": str(e)})
+    finally:
+        # Если клиент отключился до первой стадии, корутина извлечения так и не была запущена
+        if hasattr(extraction, "close"):
+            extraction.close()
+
+
+def _stream(
+    extraction: Awaitable[AIResponse],
+    language: str,
+    num_questions: int,
+    uploads: Optional[List[SpooledUpload]] = None
+) -> StreamingResponse:
+    # Временные файлы загрузок удаляются после отправки ответа, в том числе при отключении клиента
+    cleanup = BackgroundTask(lambda: [upload.close() for upload in uploads]) if uploads else None
+    return StreamingResponse(
+        _run_pipeline(extraction, language, num_questions),
+        media_type="application/x-ndjson",
+        background=cleanup
+    )
+
+
+@router.post("/pdf")
+async def pipeline_pdf(
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    num_questions: int = Form(5),
+    first_page: Optional[int] = Form(None),
+    last_page: Optional[int] = Form(None)
+):
+    process_pdf = get_processor("pdf")
+    validate_file(file, "pdf")
+    upload = await spool_upload(file)
+    extraction = process_pdf(upload.source, language=language, first_page=first_page, last_page=last_page)
+    return _stream(extraction, language, num_questions, [upload])
+
+
+@router.post("/doc")
+async def pipeline_doc(
+    file: UploadFile = File(...),
+    language: str = Form("auto"),
+    num_questions: int = Form(5)
+):
+    process_doc = get_processor("doc")
+    validate_file(file, "doc")
+    upload = await spool_upload(file)
+    return _stream(process_doc(upload.source, language=language), language, num_questions, [upload])
+
+
+@router.post("/txt")
+async def pipeline_txt(
+    files: List[UploadFile] = File(...),
+    language: str = Form("auto"),
+    num_questions: int = Form(5)
+):
+    process_txt = get_processor("txt")
+    for file in files:
+        validate_file(file, "txt")
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await spool_upload(file))
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    return _stream(process_txt([upload.source for upload in uploads], language=language), language, num_questions, uploads)
+
+
+@router.post("/png")
+async def pipeline_png(
+    files: List[str] = Form(...),
+    language: str = Form("auto"),
+    num_questions: int = Form(5)
+):
+    process_png = get_processor("png")
+    return _stream(process_png(files, language=language), language, num_questions)